@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+# =================================================================
+# Copyright 2022 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =================================================================
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from run_benchmarks import SCRIPT, percentile
+
+#####################################################################
+# Measure the startup time of turbonomic_server.py processes that   #
+# make no API calls, the fixed cost paid by every one of the many   #
+# camc_scriptpackage invocations. No server is needed: the endpoint #
+# is unreachable, so a case that tries to connect shows up as an    #
+# error rather than a timing.                                       #
+#####################################################################
+
+# Each case is a command, without the interpreter, and the exit codes it may end with
+CASES = [
+            ('interpreter',     ['-c', 'pass'],                                                  (0,)),
+            ('import_requests', ['-c', 'import requests'],                                       (0,)),
+            ('help',            [SCRIPT, '--help'],                                              (0,)),
+            ('invalid_args',    [SCRIPT, '-g', 'group', '-T', 'NotAGroupType'],                  (1,)),
+            ('missing_args',    [SCRIPT, '-g', 'group', '-T', 'VirtualMachine'],                 (1,)),
+            ('bad_manifest',    [SCRIPT, '-m', os.path.join(os.sep, 'nonexistent', 'manifest')], (1,))
+        ]
+
+def measure(command, exit_codes, iterations, environ):
+    '''
+    Run a command a number of times.
+
+    Parameters:
+        command    : Command line arguments for the interpreter
+        exit_codes : Exit codes the command is expected to end with
+        iterations : Number of runs
+        environ    : Environment for the command
+
+    Returns:
+        The wall time of each run, in seconds
+    '''
+    times = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable] + command, env=environ,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=False)
+        times.append(time.perf_counter() - start)
+        if completed.returncode not in exit_codes:
+            raise RuntimeError(' '.join(command) + ' exited with ' + str(completed.returncode) + ': ' +
+                               completed.stderr.decode('utf-8', 'replace')[-500:])
+    return times
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(description='Measure the startup time of turbonomic_server.py.')
+    parser.add_argument('--cases', default=','.join(name for name, command, exit_codes in CASES),
+                        help='Comma separated cases: ' + ', '.join(name for name, command, exit_codes in CASES))
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args(argv[1:])
+
+    names = [name.strip() for name in args.cases.split(',') if name.strip()]
+    unknown = [name for name in names if name not in [case[0] for case in CASES]]
+    if len(unknown) > 0:
+        parser.error('unknown cases ' + ', '.join(unknown))
+
+    # Port 9 is discard, so a case that connects fails at once instead of reaching a server
+    environ = {name: value for name, value in os.environ.items() if not name.startswith('TURBONOMIC_')}
+    environ['TURBONOMIC_ENDPOINT'] = 'http://127.0.0.1:9'
+    environ['TURBONOMIC_USER'] = 'user'
+    environ['TURBONOMIC_PASSWORD'] = 'password'
+    environ['TURBONOMIC_DAEMON_SOCKET'] = os.path.join(os.sep, 'nonexistent', 'daemon.sock')
+    environ['TURBONOMIC_RETRY_ATTEMPTS'] = '1'
+
+    results = []
+    for name, command, exit_codes in CASES:
+        if name not in names:
+            continue
+        times = measure(command, exit_codes, args.iterations, environ)
+        results.append({
+                           'case': name,
+                           'iterations': args.iterations,
+                           'mean': sum(times) / len(times),
+                           'p50': percentile(times, 50),
+                           'p99': percentile(times, 99)
+                       })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        width = max(len(result['case']) for result in results + [{'case': 'case'}])
+        print('case'.ljust(width) + '  mean (ms)  p50 (ms)  p99 (ms)')
+        for result in results:
+            print(result['case'].ljust(width) + '  ' + '  '.join('{:9.1f}'.format(result[stat] * 1000).rjust(len(heading))
+                                                                 for stat, heading in (('mean', 'mean (ms)'), ('p50', 'p50 (ms)'), ('p99', 'p99 (ms)'))))
+    return(0)
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,285 @@
+#!/usr/bin/python3
+# =================================================================
+# Copyright 2022 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =================================================================
+
+import argparse
+import json
+import random
+import ssl
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+#####################################################################
+# A local stand-in for the parts of the Turbonomic REST API used by #
+# turbonomic_server.py, with configurable latency, error rate, and  #
+# dataset sizes. It is only meant for benchmarks.                   #
+#####################################################################
+AUTH_COOKIE = 'JSESSIONID=mock-session'
+
+# Collections served under /api/v3, and the workflow the IA scale policy looks up
+COLLECTIONS = ['groups', 'topologydefinitions', 'settingspolicies', 'workflows']
+IA_WORKFLOW_NAME = 'IAScaleActionTest'
+
+class MockTurbonomic:
+    '''
+    The in-memory state of the mock server.
+    '''
+
+    def __init__(self, workflows, groups, services, policies, latency, login_latency, jitter, error_rate):
+        '''
+        Parameters:
+            workflows     : Number of workflows to generate
+            groups        : Number of groups to generate
+            services      : Number of services to generate
+            policies      : Number of settings policies to generate
+            latency       : Seconds added to every request
+            login_latency : Seconds added to every login
+            jitter        : Maximum random seconds added on top of the latency
+            error_rate    : Fraction of requests answered with a 503
+        '''
+        self.latency = latency
+        self.login_latency = login_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.stats = {'connections': 0, 'requests': 0, 'logins': 0, 'errors': 0}
+
+        self.collections = {name: {} for name in COLLECTIONS}
+        for i in range(groups):
+            self.add('groups', {'displayName': 'mock-group-' + str(i), 'groupType': 'VirtualMachine', 'isStatic': False,
+                                'criteriaList': [{'expType': 'EQ', 'expVal': 'service_identifier=mock-' + str(i),
+                                                  'filterType': 'vmsByTag', 'caseSensitive': False}]})
+        for i in range(services):
+            self.add('topologydefinitions', {'displayName': 'mock-service-' + str(i), 'entityType': 'Service',
+                                             'entityDefinitionData': {'manualConnectionData': {}}})
+        for i in range(policies):
+            self.add('settingspolicies', {'displayName': 'mock-policy-' + str(i), 'entityType': 'VirtualMachine',
+                                          'disabled': False, 'scopes': [], 'settingsManagers': []})
+
+        # The IA workflow is last so a linear scan of the list is the worst case
+        for i in range(max(0, workflows - 1)):
+            self.add('workflows', {'displayName': 'mock-workflow-' + str(i), 'entityType': 'VirtualMachine',
+                                   'actionType': 'RESIZE', 'className': 'Workflow'})
+        self.add('workflows', {'displayName': IA_WORKFLOW_NAME, 'entityType': 'VirtualMachine',
+                               'actionType': 'SCALE', 'className': 'Workflow'})
+
+    def add(self, collection, resource):
+        '''
+        Add a resource to a collection, giving it a new uuid.
+
+        Parameters:
+            collection : The collection name
+            resource   : The resource
+
+        Returns:
+            The resource
+        '''
+        resource = dict(resource)
+        resource['uuid'] = uuid.uuid4().hex
+        if collection == 'groups':
+            resource.setdefault('membersCount', 0)
+        with self.lock:
+            self.collections[collection][resource['uuid']] = resource
+        return resource
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    '''
+    Handle one request to the mock Turbonomic REST API.
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.mock.count('connections')
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_PUT(self):
+        self.handle_request('PUT')
+
+    def do_DELETE(self):
+        self.handle_request('DELETE')
+
+    def send_json(self, status_code, data, headers=None):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self, method):
+        mock = self.server.mock
+        mock.count('requests')
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.split('/')[3:] if url.path.startswith('/api/v3/') else []
+
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length > 0 else None
+
+        # Benchmark bookkeeping, not part of the Turbonomic API
+        if parts == ['mock', 'stats']:
+            with mock.lock:
+                return self.send_json(200, dict(mock.stats))
+
+        if parts == ['login']:
+            mock.count('logins')
+            time.sleep(mock.login_latency + random.uniform(0, mock.jitter))
+            return self.send_json(200, {'username': query.get('username', [''])[0]},
+                                  {'Set-Cookie': AUTH_COOKIE + '; Path=/; Secure; HttpOnly'})
+
+        time.sleep(mock.latency + random.uniform(0, mock.jitter))
+
+        if random.random() < mock.error_rate:
+            mock.count('errors')
+            return self.send_json(503, {'error': 'Service Unavailable'}, {'Retry-After': '0'})
+
+        if self.headers.get('cookie') != AUTH_COOKIE:
+            return self.send_json(401, {'error': 'Unauthorized'})
+
+        if parts == ['users', 'me']:
+            return self.send_json(200, {'username': 'mock'})
+
+        if len(parts) == 0 or parts[0] not in mock.collections:
+            return self.send_json(404, {'error': 'Not Found'})
+
+        collection = parts[0]
+        status_code, data, headers = 404, {'error': 'Not Found'}, None
+        with mock.lock:
+            resources = mock.collections[collection]
+            if len(parts) == 1 and method == 'GET':
+                status_code, data, headers = self.list_page(list(resources.values()), query)
+
+            elif len(parts) == 1 and method == 'POST':
+                resource = dict(body or {})
+                resource['uuid'] = uuid.uuid4().hex
+                if collection == 'groups':
+                    resource.setdefault('membersCount', 0)
+                resources[resource['uuid']] = resource
+                status_code, data = 200, resource
+
+            elif len(parts) == 2 and parts[1] in resources:
+                id = parts[1]
+                if method == 'GET':
+                    status_code, data = 200, resources[id]
+                elif method == 'PUT':
+                    resource = dict(body or {})
+                    resource['uuid'] = id
+                    resources[id] = resource
+                    status_code, data = 200, resource
+                elif method == 'DELETE':
+                    del resources[id]
+                    status_code, data = 200, {}
+
+        # Send outside the lock so a large list does not hold up other requests
+        return self.send_json(status_code, data, headers)
+
+    def list_page(self, resources, query):
+        '''
+        Get a list response, one page at a time when a limit is given,
+        using the cursor and X-Next-Cursor convention of the Turbonomic API.
+
+        Returns:
+            The status code, the resources in the page, and the response headers
+        '''
+        headers = {'X-Total-Record-Count': str(len(resources))}
+        if 'limit' not in query:
+            return 200, resources, headers
+
+        cursor = int(query.get('cursor', ['0'])[0] or 0)
+        limit = int(query['limit'][0])
+        if cursor + limit < len(resources):
+            headers['X-Next-Cursor'] = str(cursor + limit)
+        return 200, resources[cursor:cursor + limit], headers
+
+def serve(mock, port, certfile=None, keyfile=None, ready=None):
+    '''
+    Serve the mock API until interrupted.
+
+    Parameters:
+        mock     : The MockTurbonomic state
+        port     : Port to listen on. 0 picks a free port.
+        certfile : TLS certificate, or None to serve plain HTTP
+        keyfile  : TLS private key
+        ready    : Function called with the URL of the server once it is listening
+    '''
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockRequestHandler)
+    server.daemon_threads = True
+    server.mock = mock
+
+    scheme = 'http'
+    if certfile is not None:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = 'https'
+
+    url = scheme + '://127.0.0.1:' + str(server.server_address[1])
+    if ready is not None:
+        ready(url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(description='Serve a mock Turbonomic REST API for benchmarks.')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--workflows', type=int, default=1000)
+    parser.add_argument('--groups', type=int, default=1000)
+    parser.add_argument('--services', type=int, default=100)
+    parser.add_argument('--policies', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds added to every request')
+    parser.add_argument('--login_latency', type=float, default=0.2, help='Seconds added to every login')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Maximum random seconds added to the latency')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='Fraction of requests answered with a 503')
+    parser.add_argument('--certfile', default=None)
+    parser.add_argument('--keyfile', default=None)
+    args = parser.parse_args(argv[1:])
+
+    mock = MockTurbonomic(args.workflows, args.groups, args.services, args.policies,
+                          args.latency, args.login_latency, args.jitter, args.error_rate)
+
+    # The URL is the first line on stdout so a harness can read it
+    def ready(url):
+        print(url, flush=True)
+
+    serve(mock, args.port, args.certfile, args.keyfile, ready)
+    return(0)
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
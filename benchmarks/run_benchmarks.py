@@ -0,0 +1,345 @@
+#!/usr/bin/python3
+# =================================================================
+# Copyright 2022 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =================================================================
+
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+#####################################################################
+# Drive turbonomic_server.py end to end against the mock Turbonomic #
+# API in mock_turbonomic_server.py and report throughput and p50 /  #
+# p99 latency. Every invocation is a separate process, the way the  #
+# camc_scriptpackage resources run the script.                      #
+#####################################################################
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+MOCK_SERVER = os.path.join(BENCHMARK_DIR, 'mock_turbonomic_server.py')
+SCRIPT = os.path.join(BENCHMARK_DIR, '..', 'terraform', 'modules', 'scripts', 'turbonomic_server.py')
+
+SCENARIOS = ['single_create', 'service_provisioning', 'manifest_provisioning', 'bulk_delete']
+
+# Credentials accepted by the mock server
+MOCK_USER = 'administrator'
+MOCK_PASSWORD = 'mock-password'
+
+def percentile(values, percent):
+    '''
+    Get a percentile of a list of values using the nearest rank method.
+
+    Parameters:
+        values  : The values
+        percent : The percentile, from 0 to 100
+
+    Returns:
+        The percentile, or None if there are no values
+    '''
+    if len(values) == 0:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(percent / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+class Benchmark:
+    '''
+    Runs the scenarios against one mock server.
+    '''
+
+    def __init__(self, url, environ, verbose=False):
+        '''
+        Parameters:
+            url     : URL of the mock server
+            environ : Environment for turbonomic_server.py
+            verbose : Pass the stderr of turbonomic_server.py through
+        '''
+        self.url = url
+        self.environ = environ
+        self.verbose = verbose
+        self.sequence = 0
+
+    def next_name(self, prefix):
+        self.sequence += 1
+        return prefix + '-' + str(os.getpid()) + '-' + str(self.sequence)
+
+    def run_script(self, args):
+        '''
+        Run turbonomic_server.py once.
+
+        Parameters:
+            args : Command line arguments
+
+        Returns:
+            The JSON the script wrote to stdout, or None if it wrote nothing
+        '''
+        stderr = None if self.verbose else subprocess.DEVNULL
+        completed = subprocess.run([sys.executable, SCRIPT] + args, env=self.environ,
+                                   stdout=subprocess.PIPE, stderr=stderr, check=False)
+        if completed.returncode != 0:
+            raise RuntimeError('turbonomic_server.py ' + ' '.join(args) + ' exited with ' + str(completed.returncode))
+        return json.loads(completed.stdout) if completed.stdout.strip() else None
+
+    def api(self, method, path, body=None, cookie=None):
+        '''
+        Call the mock API directly, for setting up a scenario.
+
+        Returns:
+            The decoded response body and the response headers
+        '''
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        request = urllib.request.Request(self.url + '/api/v3' + path, data=data, method=method)
+        request.add_header('Content-Type', 'application/json')
+        if cookie is not None:
+            request.add_header('cookie', cookie)
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read() or 'null'), response.headers
+
+    def stats(self):
+        return self.api('GET', '/mock/stats')[0]
+
+    def create_group(self):
+        name = self.next_name('bench-group')
+        return self.run_script(['-g', name, '-T', 'VirtualMachine', '-t', 'service_identifier', '-v', name])
+
+    def single_create(self):
+        '''
+        Create one group.
+
+        Returns:
+            The number of resources created
+        '''
+        self.create_group()
+        return 1
+
+    def service_provisioning(self):
+        '''
+        Provision a service the way the Terraform modules do: the three
+        groups in parallel, then the service and the scale policy in
+        parallel, each one a separate invocation.
+
+        Returns:
+            The number of resources created
+        '''
+        name = self.next_name('bench-service')
+        group_args = [['-g', name + suffix, '-T', type, '-t', 'service_identifier', '-v', name]
+                      for suffix, type in (('-virtual-machines', 'VirtualMachine'),
+                                           ('-databases', 'Database'),
+                                           ('-database-servers', 'DatabaseServer'))]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+            groups = list(executor.map(self.run_script, group_args))
+            vm_group_id = groups[0]['group_id']
+            all_group_ids = ','.join(group['group_id'] for group in groups)
+            list(executor.map(self.run_script, [['-s', name, '-G', all_group_ids],
+                                                ['-p', 'IA-' + name, '-G', vm_group_id]]))
+        return 5
+
+    def manifest_provisioning(self):
+        '''
+        Provision the same service as service_provisioning with a
+        manifest in a single invocation.
+
+        Returns:
+            The number of resources created
+        '''
+        name = self.next_name('bench-manifest')
+        manifest = {
+                       'groups': [
+                           {'key': 'vm_group', 'name': name + '-virtual-machines', 'type': 'VirtualMachine',
+                            'tag_name': 'service_identifier', 'tag_value': name},
+                           {'key': 'db_group', 'name': name + '-databases', 'type': 'Database',
+                            'tag_name': 'service_identifier', 'tag_value': name},
+                           {'key': 'db_server_group', 'name': name + '-database-servers', 'type': 'DatabaseServer',
+                            'tag_name': 'service_identifier', 'tag_value': name}
+                       ],
+                       'services': [{'key': 'service', 'name': name, 'groups': ['vm_group', 'db_group', 'db_server_group']}],
+                       'policies': [{'key': 'vm_policy', 'name': 'IA-' + name, 'groups': ['vm_group']}]
+                   }
+
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump(manifest, f)
+        try:
+            self.run_script(['-m', f.name])
+        finally:
+            os.unlink(f.name)
+        return 5
+
+    def bulk_delete(self, count):
+        '''
+        Delete a number of groups in one invocation. The groups are
+        created directly through the mock API and are not timed.
+
+        Parameters:
+            count : Number of groups to delete
+
+        Returns:
+            A function that runs the timed part and returns the number of resources deleted
+        '''
+        _, headers = self.api('POST', '/login?username=' + MOCK_USER + '&password=' + MOCK_PASSWORD)
+        cookie = headers['set-cookie'].split(';')[0]
+
+        ids = []
+        for i in range(count):
+            group, _ = self.api('POST', '/groups', {'displayName': self.next_name('bench-delete'),
+                                                    'groupType': 'VirtualMachine'}, cookie)
+            ids.append(group['uuid'])
+
+        def run():
+            self.run_script(['-d', '-G', ','.join(ids)])
+            return count
+
+        return run
+
+    def measure(self, scenario, iterations, bulk_size):
+        '''
+        Run a scenario a number of times.
+
+        Returns:
+            The results of the scenario
+        '''
+        latencies = []
+        resources = 0
+        stats = self.stats()
+
+        for i in range(iterations):
+            run = self.bulk_delete(bulk_size) if scenario == 'bulk_delete' else getattr(self, scenario)
+            start = time.perf_counter()
+            resources += run()
+            latencies.append(time.perf_counter() - start)
+
+        after = self.stats()
+        total = sum(latencies)
+        return {
+                   'scenario': scenario,
+                   'iterations': iterations,
+                   'resources': resources,
+                   'seconds': total,
+                   'resources_per_second': resources / total if total > 0 else None,
+                   'p50': percentile(latencies, 50),
+                   'p99': percentile(latencies, 99),
+                   'logins': after['logins'] - stats['logins'],
+                   'connections': after['connections'] - stats['connections'],
+                   'requests': after['requests'] - stats['requests']
+               }
+
+def start_mock_server(args):
+    '''
+    Start the mock server in a subprocess.
+
+    Returns:
+        The process and the URL of the server
+    '''
+    command = [sys.executable, MOCK_SERVER,
+               '--workflows', str(args.workflows), '--groups', str(args.groups),
+               '--services', str(args.services), '--policies', str(args.policies),
+               '--latency', str(args.latency), '--login_latency', str(args.login_latency),
+               '--jitter', str(args.jitter), '--error_rate', str(args.error_rate)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    url = process.stdout.readline().strip()
+    if not url:
+        process.kill()
+        raise RuntimeError('The mock server did not start')
+    return process, url
+
+def start_daemon(environ):
+    '''
+    Start the turbonomic_server.py daemon and wait for its socket.
+
+    Returns:
+        The daemon process
+    '''
+    process = subprocess.Popen([sys.executable, SCRIPT, '--daemon'], env=environ, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while not os.path.exists(environ['TURBONOMIC_DAEMON_SOCKET']):
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            raise RuntimeError('The daemon did not start')
+        time.sleep(0.05)
+    return process
+
+def print_table(results):
+    columns = [('scenario', '{}'), ('iterations', '{}'), ('resources', '{}'), ('resources_per_second', '{:.2f}'),
+               ('p50', '{:.3f}'), ('p99', '{:.3f}'), ('logins', '{}'), ('connections', '{}'), ('requests', '{}')]
+    headings = ['scenario', 'iterations', 'resources', 'resources/s', 'p50 (s)', 'p99 (s)', 'logins', 'connections', 'requests']
+
+    rows = [[format.format(result[name]) if result[name] is not None else '-' for name, format in columns]
+            for result in results]
+    widths = [max(len(row[i]) for row in rows + [headings]) for i in range(len(headings))]
+    for row in [headings] + rows:
+        print('  '.join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip())
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(description='Benchmark turbonomic_server.py against a mock Turbonomic API.')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma separated scenarios: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--bulk_size', type=int, default=50, help='Number of ids deleted by the bulk_delete scenario')
+    parser.add_argument('--workflows', type=int, default=1000)
+    parser.add_argument('--groups', type=int, default=1000)
+    parser.add_argument('--services', type=int, default=100)
+    parser.add_argument('--policies', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds the mock server adds to every request')
+    parser.add_argument('--login_latency', type=float, default=0.2, help='Seconds the mock server adds to every login')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error_rate', type=float, default=0.0)
+    parser.add_argument('--cache', action='store_true', help='Use a local cache directory for the cookie and the workflow index')
+    parser.add_argument('--daemon', action='store_true', help='Run the invocations through the turbonomic_server.py daemon')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Show the stderr of turbonomic_server.py')
+    args = parser.parse_args(argv[1:])
+
+    scenarios = [scenario.strip() for scenario in args.scenarios.split(',') if scenario.strip()]
+    unknown = [scenario for scenario in scenarios if scenario not in SCENARIOS]
+    if len(unknown) > 0:
+        parser.error('unknown scenarios ' + ', '.join(unknown))
+
+    mock_server, url = start_mock_server(args)
+    daemon = None
+    with tempfile.TemporaryDirectory() as work_dir:
+        environ = dict(os.environ)
+        environ['TURBONOMIC_ENDPOINT'] = url
+        environ['TURBONOMIC_USER'] = MOCK_USER
+        environ['TURBONOMIC_PASSWORD'] = MOCK_PASSWORD
+        environ['TURBONOMIC_DAEMON_SOCKET'] = os.path.join(work_dir, 'daemon.sock')
+        environ.pop('TURBONOMIC_CACHE_DIR', None)
+        if args.cache:
+            environ['TURBONOMIC_CACHE_DIR'] = os.path.join(work_dir, 'cache')
+
+        try:
+            if args.daemon:
+                daemon = start_daemon(environ)
+
+            benchmark = Benchmark(url, environ, args.verbose)
+            results = [benchmark.measure(scenario, args.iterations, args.bulk_size) for scenario in scenarios]
+        finally:
+            if daemon is not None:
+                daemon.terminate()
+                daemon.wait()
+            mock_server.terminate()
+            mock_server.wait()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+    return(0)
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
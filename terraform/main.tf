@@ -33,7 +33,7 @@ locals {
   virtual_machine_group_name   = "${local.service_name}-virtual-machines"
   database_group_name          = "${local.service_name}-databases"
   database_server_group_name   = "${local.service_name}-database-servers"
-  virtual_machine_policy_name  = local.service_name
+  virtual_machine_policy_name  = var.share_virtual_machine_policy ? "IAScaleActionTest-shared" : local.service_name
 
   # Tag filter for group resources
   tag_name  = "service_identifier"
@@ -50,6 +50,7 @@ module "create_virtual_machine_group" {
   type      = "VirtualMachine"
   tag_name  = local.tag_name
   tag_value = local.tag_value
+  wait_for_members = var.wait_for_group_members
 }
 
 ############################################################
@@ -62,6 +63,7 @@ module "create_database_group" {
   type      = "Database"
   tag_name  = local.tag_name
   tag_value = local.tag_value
+  wait_for_members = var.wait_for_group_members
 }
 
 ############################################################
@@ -74,6 +76,7 @@ module "create_database_server_group" {
   type      = "DatabaseServer"
   tag_name  = local.tag_name
   tag_value = local.tag_value
+  wait_for_members = var.wait_for_group_members
 }
 
 ############################################################
@@ -84,6 +87,7 @@ module "create_virtual_machine_policy" {
   source    = "./modules/create_policy"
   name      = local.virtual_machine_policy_name
   group_ids = module.create_virtual_machine_group[0].group_id
+  shared    = var.share_virtual_machine_policy
 }
 
 ############################################################
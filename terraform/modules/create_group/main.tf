@@ -13,7 +13,7 @@ terraform {
 # Create a group                             #
 ##############################################
 resource "camc_scriptpackage" "create_group" {
-  program = ["/usr/bin/python3", "${path.module}/../scripts/turbonomic_server.py", "-g", "${var.name}", "-T", "${var.type}", "-t", "${var.tag_name}", "-v", "${var.tag_value}"]
+  program = concat(["/usr/bin/python3", "${path.module}/../scripts/turbonomic_server.py", "-g", "${var.name}", "-T", "${var.type}", "-t", "${var.tag_name}", "-v", "${var.tag_value}"], var.wait_for_members ? tolist(["--wait_for_members"]) : tolist([]))
   on_create = true
 }
 
@@ -1,4 +1,9 @@
 output "group_id" {
   description = "The ID of the group"
   value = lookup(camc_scriptpackage.create_group.result, "group_id")
-}
\ No newline at end of file
+}
+
+output "members_count" {
+  description = "The number of members in the group, when waiting for members"
+  value = lookup(camc_scriptpackage.create_group.result, "members_count", "")
+}
@@ -16,4 +16,10 @@ variable "tag_name" {
 variable "tag_value" {
   type = string
   description = "Resources with this tag name and value are added to the group"
+}
+
+variable "wait_for_members" {
+  type = bool
+  description = "Whether to wait until Turbonomic has added members to the group"
+  default = false
 }
\ No newline at end of file
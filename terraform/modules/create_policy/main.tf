@@ -13,15 +13,16 @@ terraform {
 # Create a virtual machine policy            #
 ##############################################
 resource "camc_scriptpackage" "create_policy" {
-  program = ["/usr/bin/python3", "${path.module}/../scripts/turbonomic_server.py", "-p", "${var.name}", "-G", "${var.group_ids}"]
+  program = concat(["/usr/bin/python3", "${path.module}/../scripts/turbonomic_server.py", "-p", "${var.name}", "-G", "${var.group_ids}"], var.shared ? tolist(["--shared_policy"]) : tolist([]))
   on_create = true
 }
 
 ##############################################
-# Delete a virtual machine policy            #
+# Delete a virtual machine policy, or remove #
+# the groups from the shared policy          #
 ##############################################
 resource "camc_scriptpackage" "delete_policy" {
   depends_on = [camc_scriptpackage.create_policy]
-  program = ["/usr/bin/python3", "${path.module}/../scripts/turbonomic_server.py", "-d", "-P", lookup(camc_scriptpackage.create_policy.result, "policy_id")]
+  program = concat(["/usr/bin/python3", "${path.module}/../scripts/turbonomic_server.py", "-d"], var.shared ? tolist(["--shared_policy", "-p", var.name, "-G", var.group_ids]) : tolist(["-P", lookup(camc_scriptpackage.create_policy.result, "policy_id")]))
   on_delete = true
 }
@@ -6,4 +6,10 @@ variable "name" {
 variable "group_ids" {
   type = string
   description = "Comma separated list of group ids to which this policy is to be added"
+}
+
+variable "shared" {
+  type = bool
+  description = "Whether to add the groups to the scope of a policy shared by many services instead of creating a policy"
+  default = false
 }
\ No newline at end of file
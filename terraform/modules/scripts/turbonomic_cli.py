@@ -0,0 +1,4814 @@
+#!/usr/bin/python3
+# =================================================================
+# Copyright 2022 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =================================================================
+
+import argparse
+import codecs
+import concurrent.futures
+import contextlib
+import contextvars
+import collections
+import copy
+import datetime
+import email.utils
+import fcntl
+import functools
+import hashlib
+import importlib
+import io
+import itertools
+import json
+import math
+import os
+import random
+import re
+import signal
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+
+#####################################################################
+# Deferred imports                                                  #
+#####################################################################
+
+class LazyModule:
+    '''
+    A module that is imported the first time one of its attributes is
+    used. requests and asyncio take longer to import than the rest of
+    this script, and a run that only validates its arguments, prints the
+    help, or is forwarded to the daemon never needs them.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.module = None
+
+    def __getattr__(self, attribute):
+        if self.module is None:
+            self.module = importlib.import_module(self.name)
+        return getattr(self.module, attribute)
+
+asyncio = LazyModule('asyncio')
+requests = LazyModule('requests')
+
+#####################################################################
+# Supported Turbonomic group types                                  #
+#####################################################################
+VIRTUAL_MACHINE       = 'VirtualMachine'
+VIRTUAL_MACHINE_LOWER = 'virtualmachine'
+DATABASE              = 'Database'
+DATABASE_LOWER        = 'database'
+DATABASE_SERVER       = 'DatabaseServer'
+DATABASE_SERVER_LOWER = 'databaseserver'
+
+#####################################################################
+# Custom IA scale action workflow display name                      #
+#####################################################################
+ia_workflow_name = 'IAScaleActionTest'
+
+#####################################################################
+# Shared IA scale action policy                                     #
+#####################################################################
+
+# Attempts to update the scope of the shared policy, and the status codes of a conflicting update
+SHARED_POLICY_ATTEMPTS    = 5
+CONFLICT_STATUS_CODES     = (409, 412)
+SHARED_POLICY_RETRY_DELAY = 0.5
+
+# Name of the shared policy, as in terraform/main.tf
+DEFAULT_SHARED_POLICY_NAME = ia_workflow_name + '-shared'
+
+#####################################################################
+# HTTP connection pool settings                                     #
+#####################################################################
+DEFAULT_POOL_SIZE = 10
+
+#####################################################################
+# Retry settings                                                    #
+#   TURBONOMIC_RETRY_ATTEMPTS   : Attempts per API call             #
+#   TURBONOMIC_RETRY_BUDGET     : Retries allowed for the whole run #
+#   TURBONOMIC_REQUEST_TIMEOUT  : Seconds to wait for a response    #
+#####################################################################
+RETRY_ATTEMPTS_ENV         = 'TURBONOMIC_RETRY_ATTEMPTS'
+RETRY_BUDGET_ENV           = 'TURBONOMIC_RETRY_BUDGET'
+REQUEST_TIMEOUT_ENV        = 'TURBONOMIC_REQUEST_TIMEOUT'
+DEFAULT_RETRY_ATTEMPTS     = 4
+DEFAULT_RETRY_BUDGET       = 50
+DEFAULT_REQUEST_TIMEOUT    = 60
+CONNECT_TIMEOUT            = 10
+RETRY_BASE_DELAY           = 0.5
+RETRY_MAX_DELAY            = 30
+
+# Status codes that mean the server is overloaded or unavailable and the request may be sent again
+RETRY_STATUS_CODES         = (429, 502, 503, 504)
+
+# Status codes that mean the server rejected a request without acting on it, so even a POST may be sent again
+REJECTED_STATUS_CODES      = (429, 503)
+
+# Consecutive failures that open the circuit breaker, and seconds before it lets a request through again
+BREAKER_FAILURE_THRESHOLD  = 5
+BREAKER_RESET_TIMEOUT      = 30
+
+@functools.lru_cache(maxsize=None)
+def circuit_open_error():
+    '''
+    Get the CircuitOpenError exception class. It extends the requests
+    ConnectionError, so it is defined once requests has been imported.
+
+    Returns:
+        CircuitOpenError, raised instead of sending a request while the Turbonomic API is considered down
+    '''
+    class CircuitOpenError(requests.exceptions.ConnectionError):
+        pass
+    return CircuitOpenError
+
+class RetryPolicy:
+    '''
+    Decides whether a failed API call is sent again and how long to wait first.
+
+    Delays grow exponentially with full jitter, or follow the Retry-After
+    header on a 429 or 503. Every retry is taken from a budget shared by
+    the whole run, so a struggling server is not sent an unbounded number
+    of requests.
+    '''
+
+    def __init__(self, max_attempts=DEFAULT_RETRY_ATTEMPTS, budget=DEFAULT_RETRY_BUDGET,
+                 base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+        '''
+        Parameters:
+            max_attempts : Attempts per API call, including the first
+            budget       : Retries allowed for all API calls in this run
+            base_delay   : Seconds to wait before the first retry, before jitter
+            max_delay    : Maximum seconds to wait before a retry
+        '''
+        self.max_attempts = max_attempts
+        self.budget = budget
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+
+    def should_retry(self, method, attempt, response=None, error=None):
+        '''
+        Decide whether to send a request again, taking a retry from the budget if so.
+
+        A POST is only sent again when it is known not to have been acted
+        on: the connection could not be made or the server rejected it
+        with a 429 or 503.
+
+        Parameters:
+            method   : HTTP method
+            attempt  : The number of the attempt that failed
+            response : The response, if one was received
+            error    : The exception raised, if no response was received
+
+        Returns:
+            True if the request should be sent again
+        '''
+        if attempt >= self.max_attempts:
+            return False
+
+        if error is not None:
+            if method == 'POST':
+                retryable = isinstance(error, requests.exceptions.ConnectTimeout) or self._not_connected(error)
+            else:
+                retryable = isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+        elif method == 'POST':
+            retryable = response.status_code in REJECTED_STATUS_CODES
+        else:
+            retryable = response.status_code in RETRY_STATUS_CODES
+
+        if not retryable:
+            return False
+
+        with self.lock:
+            if self.budget <= 0:
+                print_to_stderr('The retry budget for this run is exhausted')
+                return False
+            self.budget -= 1
+        return True
+
+    def delay(self, attempt, response=None):
+        '''
+        Parameters:
+            attempt  : The number of the attempt that failed
+            response : The response, if one was received
+
+        Returns:
+            Seconds to wait before the next attempt
+        '''
+        if response is not None and response.status_code in REJECTED_STATUS_CODES:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                return min(retry_after, self.max_delay)
+
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _not_connected(self, error):
+        reason = getattr(error.args[0], 'reason', None) if len(error.args) > 0 else None
+        return isinstance(reason, requests.packages.urllib3.exceptions.NewConnectionError)
+
+def parse_retry_after(value):
+    '''
+    Parse a Retry-After header.
+
+    Parameters:
+        value : The header value, in seconds or as an HTTP date, or None
+
+    Returns:
+        Seconds to wait, or None if the header is missing or not valid
+    '''
+    if value is None:
+        return None
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class CircuitBreaker:
+    '''
+    Fails API calls fast once the Turbonomic API looks down.
+
+    After BREAKER_FAILURE_THRESHOLD consecutive connection errors, timeouts,
+    or 502/503/504 responses the breaker opens and requests raise
+    CircuitOpenError without being sent. After the reset timeout a single
+    trial request is let through; if it succeeds the breaker closes.
+    '''
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        '''
+        Parameters:
+            failure_threshold : Consecutive failures that open the breaker
+            reset_timeout     : Seconds the breaker stays open before a trial request
+        '''
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    def before_request(self):
+        '''
+        Raise CircuitOpenError if a request must not be sent now.
+        '''
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.time() - self.opened_at < self.reset_timeout or self.trial_in_flight:
+                raise circuit_open_error()('The Turbonomic API is unavailable. Not sending requests for ' + str(self.reset_timeout) + ' seconds.')
+            self.trial_in_flight = True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    print_to_stderr('The Turbonomic API failed ' + str(self.failures) + ' times in a row. Failing fast for ' + str(self.reset_timeout) + ' seconds.')
+                self.opened_at = time.time()
+
+#####################################################################
+# Instrumentation                                                   #
+#   TURBONOMIC_METRICS_TEXTFILE : Prometheus textfile that the API  #
+#                                 calls of each run are added to    #
+#####################################################################
+METRICS_TEXTFILE_ENV = 'TURBONOMIC_METRICS_TEXTFILE'
+
+# Upper bounds, in seconds, of the API call latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def metrics_operation(method, path):
+    '''
+    Get the operation name used to aggregate API calls. The query string
+    is dropped and IDs in the path are replaced with {id}, so the login
+    password and resource IDs never appear in metrics.
+
+    Parameters:
+        method : HTTP method
+        path   : API path relative to /api/v3
+
+    Returns:
+        The operation name, e.g. GET /groups/{id}
+    '''
+    parts = path.split('?')[0].strip('/').split('/')
+    parts = ['{id}' if i % 2 == 1 else part for i, part in enumerate(parts)]
+    return method + ' /' + '/'.join(parts)
+
+class Metrics:
+    '''
+    Timing and counters for every Turbonomic API call made during a run,
+    aggregated by operation.
+    '''
+
+    def __init__(self):
+        self.operations = {}
+        self.lock = threading.Lock()
+
+    def record(self, method, path, status, bytes_sent, bytes_received, latency, retries):
+        '''
+        Record one API call, including its retries.
+
+        Parameters:
+            method         : HTTP method
+            path           : API path relative to /api/v3
+            status         : The final HTTP status code, or the name of the exception raised
+            bytes_sent     : Size of the request body
+            bytes_received : Size of the response body
+            latency        : Seconds from the first attempt until the call completed
+            retries        : Number of times the request was sent again
+        '''
+        operation = metrics_operation(method, path)
+        with self.lock:
+            stats = self.operations.get(operation)
+            if stats is None:
+                stats = {'count': 0, 'errors': 0, 'retries': 0, 'bytes_sent': 0, 'bytes_received': 0,
+                         'status': {}, 'latencies': [], 'buckets': [0] * len(LATENCY_BUCKETS)}
+                self.operations[operation] = stats
+
+            stats['count'] += 1
+            stats['retries'] += retries
+            stats['bytes_sent'] += bytes_sent
+            stats['bytes_received'] += bytes_received
+            stats['status'][str(status)] = stats['status'].get(str(status), 0) + 1
+            if not (isinstance(status, int) and 200 <= status < 300):
+                stats['errors'] += 1
+            stats['latencies'].append(latency)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    stats['buckets'][i] += 1
+
+    def add_bytes_received(self, method, path, size):
+        '''
+        Add to the size of the response bodies of an operation, for a
+        streamed body that is read after its API call was recorded.
+
+        Parameters:
+            method : HTTP method
+            path   : API path relative to /api/v3
+            size   : Number of bytes read
+        '''
+        operation = metrics_operation(method, path)
+        with self.lock:
+            self.operations[operation]['bytes_received'] += size
+
+    def summary(self):
+        '''
+        Returns:
+            A JSON serializable summary of the API calls, by operation
+        '''
+        with self.lock:
+            operations = {}
+            for operation, stats in sorted(self.operations.items()):
+                latencies = sorted(stats['latencies'])
+                operations[operation] = {
+                                            'count':          stats['count'],
+                                            'errors':         stats['errors'],
+                                            'retries':        stats['retries'],
+                                            'bytes_sent':     stats['bytes_sent'],
+                                            'bytes_received': stats['bytes_received'],
+                                            'status':         stats['status'],
+                                            'latency_seconds': {
+                                                'sum': round(sum(latencies), 6),
+                                                'max': round(latencies[-1], 6),
+                                                'p50': round(percentile(latencies, 50), 6),
+                                                'p99': round(percentile(latencies, 99), 6)
+                                            }
+                                        }
+
+            return {
+                       'calls':           sum(stats['count'] for stats in self.operations.values()),
+                       'retries':         sum(stats['retries'] for stats in self.operations.values()),
+                       'latency_seconds': round(sum(sum(stats['latencies']) for stats in self.operations.values()), 6),
+                       'operations':      operations
+                   }
+
+    def openmetrics(self):
+        '''
+        Returns:
+            The metrics in the Prometheus text exposition format
+        '''
+        lines = [
+                    '# HELP turbonomic_api_request_duration_seconds Latency of Turbonomic API calls, including retries.',
+                    '# TYPE turbonomic_api_request_duration_seconds histogram'
+                ]
+        with self.lock:
+            operations = sorted(self.operations.items())
+            for operation, stats in operations:
+                label = 'operation="' + operation + '"'
+                for bound, count in zip(LATENCY_BUCKETS, stats['buckets']):
+                    lines.append('turbonomic_api_request_duration_seconds_bucket{' + label + ',le="' + str(bound) + '"} ' + str(count))
+                lines.append('turbonomic_api_request_duration_seconds_bucket{' + label + ',le="+Inf"} ' + str(stats['count']))
+                lines.append('turbonomic_api_request_duration_seconds_sum{' + label + '} ' + repr(sum(stats['latencies'])))
+                lines.append('turbonomic_api_request_duration_seconds_count{' + label + '} ' + str(stats['count']))
+
+            lines.append('# HELP turbonomic_api_requests_total Turbonomic API calls by final status.')
+            lines.append('# TYPE turbonomic_api_requests_total counter')
+            for operation, stats in operations:
+                for status, count in sorted(stats['status'].items()):
+                    lines.append('turbonomic_api_requests_total{operation="' + operation + '",status="' + status + '"} ' + str(count))
+
+            for name, key, help in (('turbonomic_api_retries_total',        'retries',        'Turbonomic API requests sent again after a transient failure.'),
+                                    ('turbonomic_api_request_bytes_total',  'bytes_sent',     'Bytes sent in Turbonomic API request bodies.'),
+                                    ('turbonomic_api_response_bytes_total', 'bytes_received', 'Bytes received in Turbonomic API response bodies.')):
+                lines.append('# HELP ' + name + ' ' + help)
+                lines.append('# TYPE ' + name + ' counter')
+                for operation, stats in operations:
+                    lines.append(name + '{operation="' + operation + '"} ' + str(stats[key]))
+
+        return '\n'.join(lines) + '\n'
+
+    def report(self, textfile=None):
+        '''
+        Write the summary to stderr and, optionally, add the metrics to a
+        Prometheus textfile. Nothing is written if no API calls were made.
+
+        Every run of the script is a separate process, so the textfile
+        holds the totals of all runs. It is updated under a lock, and each
+        counter and histogram only increases.
+
+        Parameters:
+            textfile : Path of the textfile, or None
+        '''
+        if len(self.operations) == 0:
+            return
+
+        print_to_stderr(json.dumps({'turbonomic_api_metrics': self.summary()}))
+
+        if textfile:
+            with host_lock(textfile + '.lock'):
+                try:
+                    with open(textfile) as f:
+                        previous = f.read()
+                except FileNotFoundError:
+                    previous = ''
+
+                tmp_path = textfile + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    f.write(merge_openmetrics(previous, self.openmetrics()))
+                os.replace(tmp_path, textfile)
+
+def parse_openmetrics(text):
+    '''
+    Parse text written by Metrics.openmetrics.
+
+    Parameters:
+        text : The metrics in the Prometheus text exposition format
+
+    Returns:
+        A map of each metric family name to its help text, type, and a map
+        of each sample, name and labels, to its value. Maps keep the order
+        of the text.
+    '''
+    families = collections.OrderedDict()
+    family = None
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            name, _, help = line[len('# HELP '):].partition(' ')
+            family = families.setdefault(name, {'help': help, 'type': 'untyped', 'samples': collections.OrderedDict()})
+        elif line.startswith('# TYPE '):
+            name, _, type = line[len('# TYPE '):].partition(' ')
+            family = families.setdefault(name, {'help': '', 'type': type, 'samples': collections.OrderedDict()})
+            family['type'] = type
+        elif line.strip() and not line.startswith('#') and family is not None:
+            sample, _, value = line.rpartition(' ')
+            try:
+                family['samples'][sample] = int(value)
+            except ValueError:
+                family['samples'][sample] = float(value)
+    return families
+
+def merge_openmetrics(previous, current):
+    '''
+    Add the metrics of a run to the totals of earlier runs. Every metric
+    written by Metrics.openmetrics is a counter or a histogram, so each
+    sample is the sum of its values. Samples of earlier runs that this
+    run did not record are kept.
+
+    Parameters:
+        previous : The textfile written by earlier runs, or an empty string
+        current  : The metrics of this run, from Metrics.openmetrics
+
+    Returns:
+        The merged metrics in the Prometheus text exposition format
+    '''
+    families = parse_openmetrics(previous)
+    for name, family in parse_openmetrics(current).items():
+        merged = families.setdefault(name, {'help': family['help'], 'type': family['type'], 'samples': collections.OrderedDict()})
+        for sample, value in family['samples'].items():
+            merged['samples'][sample] = merged['samples'].get(sample, 0) + value
+
+    lines = []
+    for name, family in families.items():
+        lines.append('# HELP ' + name + ' ' + family['help'])
+        lines.append('# TYPE ' + name + ' ' + family['type'])
+        for sample, value in family['samples'].items():
+            lines.append(sample + ' ' + (repr(value) if isinstance(value, float) else str(value)))
+    return '\n'.join(lines) + '\n'
+
+def percentile(values, percent):
+    '''
+    Parameters:
+        values  : Sorted list of values
+        percent : The percentile, 0 to 100
+
+    Returns:
+        The nearest rank percentile of the values, or 0 if there are none
+    '''
+    if len(values) == 0:
+        return 0
+    return values[max(0, int(math.ceil(percent / 100.0 * len(values))) - 1)]
+
+#####################################################################
+# Record and replay                                                 #
+#####################################################################
+CASSETTE_VERSION = 1
+
+# Response headers kept in a cassette, the ones the client reads
+CASSETTE_HEADERS = ('Content-Type', 'Retry-After', 'Set-Cookie', 'X-Next-Cursor', 'X-Total-Record-Count')
+
+# Status code of a replayed request that is not in the cassette
+NOT_RECORDED_STATUS = 501
+
+def redact(path, headers=None):
+    '''
+    Remove credentials from a request path and response headers. The
+    login call sends the password in the query string, and its response
+    sets the session cookie.
+
+    Parameters:
+        path    : The request path and query string
+        headers : The response headers, or None
+
+    Returns:
+        The redacted path, or the redacted path and headers
+    '''
+    path = re.sub(r'(password=)[^&]*', r'\1REDACTED', path)
+    if headers is None:
+        return path
+
+    # Header names are case insensitive. They are recorded with the names in CASSETTE_HEADERS.
+    names = {name.lower(): name for name in CASSETTE_HEADERS}
+    headers = {names[name.lower()]: value for name, value in headers.items() if name.lower() in names}
+    if 'Set-Cookie' in headers:
+        headers['Set-Cookie'] = re.sub(r'^([^=;]*)=[^;]*', r'\1=REDACTED', headers['Set-Cookie'])
+    return path, headers
+
+class Cassette:
+    '''
+    Turbonomic API requests and responses, with their timings, recorded
+    during a run and replayed later without a Turbonomic server.
+
+    A cassette is a file of JSON lines: a header, then one line per
+    request. The host is not recorded, so a cassette can be replayed
+    with any TURBONOMIC_ENDPOINT. The login password and session cookie
+    are redacted.
+    '''
+
+    def __init__(self, path, replay=False, scale=1.0):
+        '''
+        Parameters:
+            path   : Path of the cassette file
+            replay : False to record a new cassette, True to replay it
+            scale  : Factor applied to the recorded latency when replaying. 0 replays without delay.
+        '''
+        self.path = path
+        self.replay = replay
+        self.scale = scale
+        self.lock = threading.Lock()
+        self.file = None
+        self.interactions = collections.defaultdict(collections.deque)
+
+        if replay:
+            with open(path) as f:
+                header = json.loads(f.readline())
+                if header.get('cassette') != CASSETTE_VERSION:
+                    raise ValueError('Unsupported cassette version ' + str(header.get('cassette')))
+                for line in f:
+                    interaction = json.loads(line)
+                    # Keyed with and without the request body, for requests whose body changed
+                    self.interactions[(interaction['method'], interaction['path'], interaction['body'])].append(interaction)
+                    self.interactions[(interaction['method'], interaction['path'])].append(interaction)
+        else:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            self.file = os.fdopen(fd, 'w')
+            self._write({'cassette': CASSETTE_VERSION, 'recorded': time.time()})
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+    def adapter(self, adapter):
+        '''
+        Get a transport adapter that records the requests sent by an
+        adapter, or replays them.
+
+        Parameters:
+            adapter : The requests transport adapter that sends the requests
+
+        Returns:
+            A CassetteAdapter
+        '''
+        return CassetteAdapter(self, adapter)
+
+    def record(self, request, response, elapsed):
+        '''
+        Record a request and its response. The response body is read.
+
+        Parameters:
+            request  : The requests.PreparedRequest
+            response : The requests.Response
+            elapsed  : Seconds until the response body was read
+        '''
+        path, headers = redact(self._path(request), response.headers)
+        self._write({
+                        'method': request.method,
+                        'path': path,
+                        'body': self._body(request),
+                        'status': response.status_code,
+                        'headers': headers,
+                        'response': response.content.decode('utf-8', 'replace'),
+                        'elapsed': round(elapsed, 6)
+                    })
+
+    def play(self, request):
+        '''
+        Get the recorded response to a request, after the recorded latency.
+        Identical requests get their recorded responses in order, and the
+        last response is repeated when they run out.
+
+        Parameters:
+            request : The requests.PreparedRequest
+
+        Returns:
+            The requests.Response
+        '''
+        path = redact(self._path(request))
+        with self.lock:
+            interaction = None
+            for key in ((request.method, path, self._body(request)), (request.method, path)):
+                queue = self.interactions.get(key)
+                if queue:
+                    interaction = queue.popleft() if len(queue) > 1 else queue[0]
+                    break
+
+        response = requests.models.Response()
+        response.request = request
+        response.url = request.url
+        response.encoding = 'utf-8'
+        response._content_consumed = True
+        if interaction is None:
+            response.status_code = NOT_RECORDED_STATUS
+            response._content = json.dumps({'error': 'Not recorded: ' + request.method + ' ' + path}).encode('utf-8')
+            return response
+
+        time.sleep(interaction['elapsed'] * self.scale)
+        response.status_code = interaction['status']
+        response.headers = requests.structures.CaseInsensitiveDict(interaction['headers'])
+        response._content = interaction['response'].encode('utf-8')
+        response.elapsed = datetime.timedelta(seconds=interaction['elapsed'])
+        return response
+
+    def _path(self, request):
+        url = request.url.split('://', 1)[-1]
+        return url[url.find('/'):] if '/' in url else '/'
+
+    def _body(self, request):
+        body = request.body or ''
+        return body.decode('utf-8', 'replace') if isinstance(body, bytes) else body
+
+    def _write(self, data):
+        with self.lock:
+            self.file.write(json.dumps(data, separators=(',', ':')) + '\n')
+            self.file.flush()
+
+class CassetteAdapter:
+    '''
+    A requests transport adapter that records the requests sent by
+    another adapter in a cassette, or replays them from it. It has the
+    send and close methods of requests.adapters.BaseAdapter.
+    '''
+
+    def __init__(self, cassette, adapter):
+        self.cassette = cassette
+        self.adapter = adapter
+
+    def send(self, request, **kwargs):
+        if self.cassette.replay:
+            return self.cassette.play(request)
+
+        started = time.time()
+        response = self.adapter.send(request, **kwargs)
+        self.cassette.record(request, response, time.time() - started)
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+def open_cassette(argv, cwd=None):
+    '''
+    Open the cassette given by the --record or --replay option.
+
+    Parameters:
+        argv : The command line arguments
+        cwd  : Directory relative paths are resolved against, or None for the working directory
+
+    Returns:
+        The Cassette, or None if neither option is given. Raises OSError or
+        ValueError if the cassette can not be opened.
+    '''
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--record', default=None)
+    parser.add_argument('--replay', default=None)
+    parser.add_argument('--replay_scale', type=float, default=1.0)
+    args, _ = parser.parse_known_args(argv[1:])
+
+    if args.replay is not None:
+        return Cassette(resolve_path(args.replay, cwd), replay=True, scale=args.replay_scale)
+    if args.record is not None:
+        return Cassette(resolve_path(args.record, cwd))
+    return None
+
+#####################################################################
+# Local cache settings                                              #
+#   TURBONOMIC_CACHE_DIR  : Enables the on-disk caches when set     #
+#   TURBONOMIC_COOKIE_TTL : Seconds a cached auth cookie is reused  #
+#   TURBONOMIC_WORKFLOW_TTL : Seconds the workflow index is reused  #
+#####################################################################
+CACHE_DIR_ENV        = 'TURBONOMIC_CACHE_DIR'
+COOKIE_TTL_ENV       = 'TURBONOMIC_COOKIE_TTL'
+DEFAULT_COOKIE_TTL   = 1800
+WORKFLOW_TTL_ENV     = 'TURBONOMIC_WORKFLOW_TTL'
+DEFAULT_WORKFLOW_TTL = 3600
+
+def host_cache_path(cache_dir, prefix, host):
+    '''
+    Get the path of a per host cache file.
+
+    Parameters:
+        cache_dir : Directory in which cache files are kept
+        prefix    : File name prefix
+        host      : URL for the Turbonomic server
+
+    Returns:
+        The path of the cache file
+    '''
+    return os.path.join(cache_dir, prefix + '-' + hashlib.sha256(host.encode('utf-8')).hexdigest()[:16] + '.json')
+
+def write_private_json(path, data):
+    '''
+    Atomically replace a file, readable only by the current user, with JSON data.
+
+    Parameters:
+        path : Path of the file
+        data : The data to write
+    '''
+    tmp_path = path + '.' + str(os.getpid()) + '.' + str(threading.get_ident())
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def user_state_dir():
+    '''
+    Get the per user directory in the temporary directory, creating it
+    so that only the current user can use it.
+
+    Returns:
+        The path of the directory. Raises OSError if it is owned by
+        another user or other users can use it.
+    '''
+    path = os.path.join(tempfile.gettempdir(), 'turbonomic-' + str(os.getuid()))
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise OSError(path + ' is not a directory that only the current user can use')
+    return path
+
+def host_state_path(environ, prefix, host):
+    '''
+    Get the path of a per host file that coordinates the processes on this host.
+
+    Parameters:
+        environ : The environment variables
+        prefix  : File name prefix
+        host    : URL for the Turbonomic server
+
+    Returns:
+        The path of the file, in the cache directory if one is set, or in
+        a per user directory in the temporary directory
+    '''
+    state_dir = environ.get(CACHE_DIR_ENV)
+    if state_dir:
+        os.makedirs(state_dir, mode=0o700, exist_ok=True)
+    else:
+        state_dir = user_state_dir()
+    return host_cache_path(state_dir, prefix, host)
+
+@contextlib.contextmanager
+def host_lock(path):
+    '''
+    Hold an exclusive file lock. Other processes and threads block until it is released.
+
+    Parameters:
+        path : Path of the lock file
+    '''
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+class CookieCache:
+    '''
+    An on-disk cache of authentication cookies shared by every process
+    on this host, keyed by Turbonomic host and user.
+
+    Each camc_scriptpackage resource runs in its own process. Caching the
+    cookie lets those processes reuse one login instead of calling
+    /api/v3/login every time. Access to the cache file is serialized with
+    an exclusive file lock, and entries expire after a TTL.
+    '''
+
+    def __init__(self, cache_dir, ttl=DEFAULT_COOKIE_TTL):
+        '''
+        Parameters:
+            cache_dir : Directory in which the cache file is kept
+            ttl       : Seconds a cached cookie may be reused
+        '''
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        self.path = os.path.join(cache_dir, 'auth_cookies.json')
+        self.lock_path = self.path + '.lock'
+        self.ttl = ttl
+
+    def lock(self):
+        '''
+        Hold the exclusive cache lock. Other processes block until it is released.
+        '''
+        return host_lock(self.lock_path)
+
+    def get(self, host, user):
+        '''
+        Get a cached cookie. The caller must hold the lock.
+
+        Parameters:
+            host : URL for the Turbonomic server
+            user : Turbonomic user
+
+        Returns:
+            The cached cookie, or None if there is no unexpired entry
+        '''
+        entry = self._read().get(self._key(host, user))
+        if entry is None or entry['expires'] <= time.time():
+            return None
+        return entry['cookie']
+
+    def put(self, host, user, cookie):
+        '''
+        Cache a cookie, or remove the entry if cookie is None. The caller must hold the lock.
+
+        Parameters:
+            host   : URL for the Turbonomic server
+            user   : Turbonomic user
+            cookie : The authentication cookie
+        '''
+        now = time.time()
+        entries = {k: v for k, v in self._read().items() if v['expires'] > now}
+        if cookie is None:
+            entries.pop(self._key(host, user), None)
+        else:
+            entries[self._key(host, user)] = {'cookie': cookie, 'expires': now + self.ttl}
+
+        write_private_json(self.path, entries)
+
+    def _key(self, host, user):
+        return hashlib.sha256((host + '\n' + user).encode('utf-8')).hexdigest()
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+class WorkflowIndex:
+    '''
+    Turbonomic workflow IDs keyed by display name, entity type, and action type.
+
+    The index is built from one download of /api/v3/workflows. When it is
+    given a path it is also kept on disk and reused by later runs until
+    its TTL expires, so looking up a workflow does not download the
+    workflow list again.
+    '''
+
+    def __init__(self, path=None, ttl=DEFAULT_WORKFLOW_TTL):
+        '''
+        Parameters:
+            path : File in which the index is kept, or None to keep it in memory only
+            ttl  : Seconds the index may be reused before it is downloaded again
+        '''
+        self.path = path
+        self.ttl = ttl
+        self.workflows = None
+        self.fetched = 0
+        self.refreshed = False
+        self.complete = False
+        self.lock = threading.Lock()
+
+        if path is not None:
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+                self.workflows = {tuple(wf[:3]): wf[3] for wf in data['workflows']}
+                self.fetched = data['fetched']
+                self.complete = True
+            except (OSError, ValueError, KeyError, IndexError, TypeError):
+                self.workflows = None
+
+    def is_stale(self):
+        '''
+        Returns:
+            True if the index has not been built or its TTL has expired
+        '''
+        return self.workflows is None or time.time() - self.fetched > self.ttl
+
+    def update(self, workflows, stop_at=None):
+        '''
+        Rebuild the index from the workflow list returned by Turbonomic.
+
+        An index that is not kept on disk stops reading the list at the
+        first workflow that exactly matches stop_at. It is then partial
+        until a later update reads the whole list.
+
+        Parameters:
+            workflows : Iterable of workflow details
+            stop_at   : The (name, entity type, action type) being looked up, or None
+        '''
+        wanted = None
+        if stop_at is not None and self.path is None:
+            wanted = (stop_at[0], self._normalize(stop_at[1]), self._normalize(stop_at[2]))
+
+        index = {}
+        complete = True
+        for wf in workflows:
+            key = (wf['displayName'], self._normalize(wf.get('entityType')), self._normalize(wf.get('actionType')))
+            index.setdefault(key, wf['uuid'])
+            if key == wanted:
+                complete = False
+                break
+
+        self.workflows = index
+        self.fetched = time.time()
+        self.refreshed = True
+        self.complete = complete
+
+        if self.path is not None:
+            write_private_json(self.path, {'fetched': self.fetched, 'workflows': [list(key) + [uuid] for key, uuid in index.items()]})
+
+    def find(self, name, entity_type, action_type):
+        '''
+        Find a workflow. Entity and action types are compared ignoring case
+        and underscores, so VIRTUAL_MACHINE matches VirtualMachine. If no
+        workflow matches all three, the first workflow with the display
+        name is returned, unless the index is partial.
+
+        Parameters:
+            name        : The workflow display name
+            entity_type : The workflow entity type
+            action_type : The workflow action type
+
+        Returns:
+            The ID of the workflow, or None if it is not in the index
+        '''
+        if self.workflows is None:
+            return None
+
+        workflow_id = self.workflows.get((name, self._normalize(entity_type), self._normalize(action_type)))
+        if workflow_id is None and self.complete:
+            workflow_id = next((uuid for key, uuid in self.workflows.items() if key[0] == name), None)
+        return workflow_id
+
+    def _normalize(self, value):
+        return (value or '').replace('_', '').lower()
+
+#####################################################################
+# Operation journal                                                 #
+#   Kept in TURBONOMIC_CACHE_DIR so a failed run can be resumed     #
+#####################################################################
+
+def journal_path(cache_dir, host, user, argv, input_paths):
+    '''
+    Get the path of the journal for a run. Runs against the same host,
+    as the same user, with the same arguments and input files share a
+    journal.
+
+    Parameters:
+        cache_dir   : Directory in which cache files are kept
+        host        : URL for the Turbonomic server
+        user        : Turbonomic user
+        argv        : The command line arguments
+        input_paths : Paths of the manifest and other files the run reads
+
+    Returns:
+        The path of the journal file
+    '''
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+    digest = hashlib.sha256(json.dumps([host, user, [arg for arg in argv[1:] if arg != '--restart']]).encode('utf-8'))
+    for path in input_paths:
+        try:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        except OSError:
+            pass
+    return os.path.join(cache_dir, 'journal-' + digest.hexdigest()[:16] + '.jsonl')
+
+class Journal:
+    '''
+    The steps of a run that completed, and the IDs they returned.
+
+    When it is given a path each completed step is appended to a file,
+    so a run that fails part way through leaves a record of what it
+    created. Running it again skips those steps and only runs the rest.
+    The file is removed when the run completes.
+    '''
+
+    def __init__(self, path=None):
+        '''
+        Parameters:
+            path : File in which completed steps are appended, or None to keep them in memory only
+        '''
+        self.path = path
+        self.prefix = ''
+        self.steps = {}
+        self.lock = threading.Lock()
+
+        if path is not None:
+            try:
+                with open(path) as f:
+                    for line in f:
+                        # A line cut short by a crash is ignored, and its step is run again
+                        try:
+                            entry = json.loads(line)
+                            self.steps[entry['step']] = entry['result']
+                        except (ValueError, KeyError, TypeError):
+                            pass
+            except OSError:
+                pass
+
+    def scoped(self, prefix):
+        '''
+        Get a view of the journal whose step names are prefixed, for the
+        steps of one item of a batch.
+
+        Parameters:
+            prefix : Prefix added to the step names
+
+        Returns:
+            A Journal that shares this journal's steps and file
+        '''
+        journal = copy.copy(self)
+        journal.prefix = self.prefix + prefix + '/'
+        return journal
+
+    def get(self, step):
+        '''
+        Parameters:
+            step : The step name
+
+        Returns:
+            The result of the step if it completed in an earlier run, or None
+        '''
+        with self.lock:
+            result = self.steps.get(self.prefix + step)
+        if result is not None:
+            print_to_stderr('Skipping ' + self.prefix + step + ', it was completed by an earlier run with id ' + str(result['id']))
+        return result
+
+    def record(self, step, result):
+        '''
+        Record the result of a step. Results of failed steps are not recorded.
+
+        Parameters:
+            step   : The step name
+            result : The status_code and id returned by the step
+        '''
+        if result['status_code'] != 200:
+            return
+
+        with self.lock:
+            self.steps[self.prefix + step] = result
+            if self.path is not None:
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+                try:
+                    os.write(fd, (json.dumps({'step': self.prefix + step, 'result': result}) + '\n').encode('utf-8'))
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+
+    def run(self, step, operation):
+        '''
+        Run a step unless it completed in an earlier run.
+
+        Parameters:
+            step      : The step name
+            operation : Function that runs the step and returns its status_code and id
+
+        Returns:
+            The result of the step
+        '''
+        result = self.get(step)
+        if result is None:
+            result = operation()
+            self.record(step, result)
+        return result
+
+    def complete(self):
+        '''
+        Forget every step, removing the journal file.
+        '''
+        with self.lock:
+            self.steps.clear()
+            if self.path is not None:
+                try:
+                    os.remove(self.path)
+                except FileNotFoundError:
+                    pass
+
+#####################################################################
+# Rate limit shared by every process on this host                   #
+#   TURBONOMIC_RATE_LIMIT    : Requests per second to each server   #
+#   TURBONOMIC_MAX_IN_FLIGHT : Requests to each server at one time  #
+#####################################################################
+RATE_LIMIT_ENV    = 'TURBONOMIC_RATE_LIMIT'
+MAX_IN_FLIGHT_ENV = 'TURBONOMIC_MAX_IN_FLIGHT'
+
+# Seconds between checks for a free in-flight slot
+IN_FLIGHT_POLL_INTERVAL = 0.05
+
+class RateLimiter:
+    '''
+    A token bucket and an in-flight limit for the requests sent to one
+    Turbonomic server, shared by every process on this host.
+
+    Terraform runs many camc_scriptpackage resources in parallel, each in
+    its own process. The bucket and the requests in flight are kept in a
+    file that is only read and written while holding an exclusive file
+    lock, so together the processes stay under the limits. Slots held by
+    processes that have exited are reclaimed.
+    '''
+
+    def __init__(self, path, rate=0, max_in_flight=0, lease=CONNECT_TIMEOUT + DEFAULT_REQUEST_TIMEOUT):
+        '''
+        Parameters:
+            path          : File in which the shared state is kept
+            rate          : Requests per second, or 0 for no limit. Up to one second of requests may be sent at once.
+            max_in_flight : Maximum number of requests in flight, or 0 for no limit
+            lease         : Seconds after which a slot that was not released is reclaimed
+        '''
+        self.path = path
+        self.rate = rate
+        self.burst = max(1.0, rate)
+        self.max_in_flight = max_in_flight
+        self.lease = lease
+
+    @contextlib.contextmanager
+    def slot(self):
+        '''
+        Wait until the limits allow another request, and hold a slot while it is sent.
+        '''
+        key = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    def acquire(self):
+        '''
+        Wait for a token and a free in-flight slot.
+
+        Returns:
+            The key of the slot, or None if requests in flight are not limited
+        '''
+        # The pid lets slots of exited processes be reclaimed. The rest is unique, as several
+        # runs in one daemon process each have their own RateLimiter.
+        key = None
+        if self.max_in_flight > 0:
+            key = str(os.getpid()) + '-' + uuid.uuid4().hex
+
+        while True:
+            with self.state() as state:
+                now = time.time()
+                self._refill(state, now)
+                self._reclaim(state, now)
+
+                if self.rate > 0 and state['tokens'] < 1:
+                    wait = (1 - state['tokens']) / self.rate
+                elif key is not None and len(state['in_flight']) >= self.max_in_flight:
+                    wait = IN_FLIGHT_POLL_INTERVAL
+                else:
+                    if self.rate > 0:
+                        state['tokens'] -= 1
+                    if key is not None:
+                        state['in_flight'][key] = now
+                    return key
+
+            time.sleep(wait)
+
+    def release(self, key):
+        '''
+        Free an in-flight slot.
+
+        Parameters:
+            key : The key returned by acquire
+        '''
+        if key is None:
+            return
+        with self.state() as state:
+            state['in_flight'].pop(key, None)
+
+    @contextlib.contextmanager
+    def state(self):
+        '''
+        Hold the exclusive lock on the state file and get the state. Changes
+        are written back when the lock is released.
+        '''
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            with os.fdopen(fd, 'r+', closefd=False) as f:
+                try:
+                    state = json.load(f)
+                except ValueError:
+                    state = {'tokens': self.burst, 'updated': time.time(), 'in_flight': {}}
+
+                yield state
+
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _refill(self, state, now):
+        if self.rate > 0:
+            state['tokens'] = min(self.burst, state['tokens'] + max(0, now - state['updated']) * self.rate)
+        state['updated'] = now
+
+    def _reclaim(self, state, now):
+        for key, started in list(state['in_flight'].items()):
+            if now - started > self.lease or not self._is_running(int(key.split('-')[0])):
+                del state['in_flight'][key]
+
+    def _is_running(self, pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+#####################################################################
+# Turbonomic REST API paths for each resource kind                  #
+#####################################################################
+RESOURCE_PATHS = {'groups': '/groups', 'services': '/topologydefinitions', 'policies': '/settingspolicies'}
+
+#####################################################################
+# Request bodies                                                    #
+#####################################################################
+
+# Group criteria filter for each group type
+GROUP_FILTER_TYPES = {VIRTUAL_MACHINE: 'vmsByTag', DATABASE: 'databaseByTag', DATABASE_SERVER: 'databaseServerByTag'}
+
+def build_group_body(name, type, tag_name, tag_value):
+    '''
+    Build the request body for a dynamic group of the entities with a tag.
+
+    Parameters:
+        name        : Group name
+        type        : Group type - VirtualMachine, Database, or DatabaseServer
+        tag_name    : Tag name to find resources to include in this group
+        tag_value   : Tag value to find resources to include in this group
+
+    Returns:
+        The JSON request body
+    '''
+    expVal = tag_name+'='+tag_value
+    return {
+               'isStatic':False,
+               'displayName':name,
+               'memberUuidList':[],
+               'criteriaList':[{'expType':'EQ','expVal':expVal,'filterType':GROUP_FILTER_TYPES[type],'caseSensitive':False}],
+               'groupType':type
+           }
+
+def build_service_body(name, vm_group_id, db_server_group_id):
+    '''
+    Build the request body for a service.
+
+    Parameters:
+        name               : Service name
+        vm_group_id        : ID of the VirtualMachine group in the service, or None
+        db_server_group_id : ID of the DatabaseServer group in the service, or None
+
+    Returns:
+        The JSON request body
+    '''
+    body = {}
+    body['displayName'] = name
+    body['entityType'] = 'Service'
+    body['entityDefinitionData'] = {}
+
+    connected_groups = {}
+    if vm_group_id is not None:
+        connected_groups[VIRTUAL_MACHINE] = {
+            "connectedGroup": {
+                "uuid": vm_group_id
+            }
+        }
+
+    if db_server_group_id is not None:
+        connected_groups[DATABASE_SERVER] = {
+            "connectedGroup": {
+                "uuid": db_server_group_id
+            }
+        }
+
+    body['entityDefinitionData']['manualConnectionData'] = connected_groups
+    return body
+
+def build_ia_vm_scale_policy_body(name, workflow_id, group_ids):
+    '''
+    Build the request body for an IA scale action virtual machine policy.
+
+    Parameters:
+        name        : Policy name
+        workflow_id : ID of the custom virtual machine scale action workflow
+        group_ids   : List of groups to which this policy will be added
+
+    Returns:
+        The JSON request body
+    '''
+    # Automation and Orchestration -> Action Types : overridden by this policy
+    automation_settings = [{'uuid': 'cloudComputeScale', 'value': 'MANUAL'}]
+
+    # Scaling Constraint that needs to be set for some reason
+    market_settings = [{'uuid': 'ignoreNvmePreRequisite','value': True}]
+
+    # Settings for workflows that replace native action handling
+    control_settings = [{'uuid': 'cloudComputeScaleActionWorkflow', 'value': workflow_id}]
+
+    return {
+               'disabled': False,
+               'entityType': VIRTUAL_MACHINE,
+               'displayName': name,
+               'scopes': [{'uuid':id} for id in group_ids],
+               'settingsManagers': [
+                   {'uuid': 'automationmanager',    'settings':automation_settings},
+                   {'uuid': 'marketsettingsmanager','settings':market_settings},
+                   {'uuid': 'controlmanager',       'settings':control_settings}
+               ]
+           }
+
+#####################################################################
+# Paginated lists                                                   #
+#   TURBONOMIC_PAGE_SIZE : Resources requested per page of a list   #
+#####################################################################
+PAGE_SIZE_ENV     = 'TURBONOMIC_PAGE_SIZE'
+DEFAULT_PAGE_SIZE = 500
+LIST_CHUNK_SIZE   = 64 * 1024
+
+JSON_WHITESPACE = re.compile(r'\s*')
+JSON_SEPARATOR  = re.compile(r'[\s,]*')
+
+class ListError(Exception):
+    '''
+    A page of a list could not be downloaded.
+    '''
+
+    def __init__(self, status_code):
+        Exception.__init__(self, 'Error ' + str(status_code) + ' getting a page of a list')
+        self.status_code = status_code
+
+def iter_json_array(chunks):
+    '''
+    Parse a JSON array one element at a time as its bytes arrive, so the
+    whole array is never held in memory.
+
+    Parameters:
+        chunks : Iterable of the bytes of the array
+
+    Returns:
+        A generator of the elements of the array
+    '''
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    started = False
+
+    for chunk in itertools.chain(chunks, [None]):
+        final = chunk is None
+        buffer += text.decode(chunk or b'', final=final)
+
+        index = 0
+        while True:
+            index = (JSON_SEPARATOR if started else JSON_WHITESPACE).match(buffer, index).end()
+            if index == len(buffer):
+                break
+
+            if not started:
+                if buffer[index] != '[':
+                    raise ValueError('Expected a JSON array')
+                started = True
+                index += 1
+                continue
+
+            if buffer[index] == ']':
+                return
+
+            # An element that reaches the end of the buffer may continue in the next chunk
+            try:
+                element, end = decoder.raw_decode(buffer, index)
+            except ValueError:
+                if final:
+                    raise
+                break
+            if end == len(buffer) and not final:
+                break
+
+            # A number cut at a chunk boundary, such as 2. or 1e, parses as just its leading digits
+            if isinstance(element, (int, float)) and not isinstance(element, bool) and not final and buffer[end] in '.eE':
+                break
+
+            yield element
+            index = end
+
+        buffer = buffer[index:]
+
+    raise ValueError('Unterminated JSON array')
+
+class ResourceIndex:
+    '''
+    The IDs of existing groups, services, and policies keyed by display name.
+
+    The list of each resource kind is downloaded at most once per run, the
+    first time a name of that kind is looked up. Resources created or
+    deleted by this run are added to or removed from the index.
+    '''
+
+    def __init__(self):
+        self.names = {}
+        self.lock = threading.Lock()
+        self.kind_locks = {kind: threading.Lock() for kind in RESOURCE_PATHS}
+
+    def find(self, client, kind, name):
+        '''
+        Find an existing resource by display name.
+
+        Parameters:
+            client : The TurbonomicClient used to download the list
+            kind   : groups, services, or policies
+            name   : The display name
+
+        Returns:
+            The ID of the resource, or None if it does not exist or the list could not be downloaded
+        '''
+        with self.kind_locks[kind]:
+            if kind not in self.names:
+                names = {}
+                try:
+                    for resource in client.iter_resources(RESOURCE_PATHS[kind], kind):
+                        names.setdefault(resource.get('displayName'), resource['uuid'])
+                except ListError:
+                    return None
+                with self.lock:
+                    self.names[kind] = names
+
+        with self.lock:
+            return self.names[kind].get(name)
+
+    def add(self, kind, name, id):
+        '''
+        Record a resource created by this run.
+
+        Parameters:
+            kind : groups, services, or policies
+            name : The display name
+            id   : The ID of the resource
+        '''
+        with self.lock:
+            if kind in self.names:
+                self.names[kind].setdefault(name, id)
+
+    def reset(self, kind):
+        '''
+        Forget the list of a resource kind, so the next lookup downloads it again.
+
+        Parameters:
+            kind : groups, services, or policies
+        '''
+        with self.lock:
+            self.names.pop(kind, None)
+
+    def discard(self, id):
+        '''
+        Forget a resource deleted by this run.
+
+        Parameters:
+            id : The ID of the resource
+        '''
+        with self.lock:
+            for names in self.names.values():
+                for name in [name for name, uuid in names.items() if uuid == id]:
+                    del names[name]
+
+# Number of IDs at which a batch lookup reads the resource list instead of getting each resource
+BATCH_LIST_THRESHOLD = 50
+
+def fetch_groups(client, ids):
+    '''
+    Get the current details of groups. The groups are fetched
+    concurrently, or read from one paginated group list when there are
+    many of them.
+
+    Parameters:
+        client : A logged in TurbonomicClient
+        ids    : List of group IDs
+
+    Returns:
+        A map keyed by group ID, with the status_code and details returned by TurbonomicClient.get_group
+    '''
+    if len(ids) == 1:
+        return {ids[0]: client.get_group(ids[0])}
+
+    if len(ids) < BATCH_LIST_THRESHOLD:
+        with ContextThreadPoolExecutor(max_workers=min(len(ids), DEFAULT_POOL_SIZE)) as executor:
+            return dict(zip(ids, executor.map(client.get_group, ids)))
+
+    # Read the group list until every group has been seen
+    wanted = set(ids)
+    found = {}
+    try:
+        with contextlib.closing(client.iter_resources('/groups', 'groups')) as groups:
+            for group in groups:
+                if group.get('uuid') in wanted:
+                    found[group['uuid']] = {'status_code':200, 'details':group}
+                    if len(found) == len(wanted):
+                        break
+    except ListError as e:
+        return {id: {'status_code':e.status_code, 'details':None} for id in ids}
+
+    return {id: found.get(id, {'status_code':404, 'details':None}) for id in ids}
+
+class GroupResolver:
+    '''
+    Group details for a run, keyed by group ID.
+
+    Each group is fetched at most once per run, however many services,
+    policies, or deletes refer to it. The groups requested together are
+    fetched concurrently, or read from one paginated group list when
+    there are many of them. Groups created by this run are added without
+    being fetched.
+    '''
+
+    def __init__(self):
+        self.groups = {}
+        self.lock = threading.Lock()
+
+    def resolve(self, client, ids):
+        '''
+        Get the details of groups.
+
+        Parameters:
+            client : The TurbonomicClient used to fetch the groups
+            ids    : List of group IDs
+
+        Returns:
+            A map keyed by group ID. Each entry has
+                status_code : The HTTP status code for the group
+                details     : The group details, or None
+        '''
+        futures = {}
+        pending = {}
+        with self.lock:
+            for id in ids:
+                if id not in self.groups:
+                    pending[id] = self.groups[id] = concurrent.futures.Future()
+                futures[id] = self.groups[id]
+
+        if len(pending) > 0:
+            try:
+                fetched = fetch_groups(client, list(pending))
+            except Exception as e:
+                with self.lock:
+                    for id, future in pending.items():
+                        self.groups.pop(id, None)
+                        future.set_exception(e)
+                raise
+
+            with self.lock:
+                for id, future in pending.items():
+                    # Only a group that exists or does not exist is remembered, not a failed request
+                    if fetched[id]['status_code'] not in (200, 404):
+                        self.groups.pop(id, None)
+                    future.set_result(fetched[id])
+
+        return {id: future.result() for id, future in futures.items()}
+
+    def known_missing(self, id):
+        '''
+        Returns:
+            True if the group was found not to exist during this run
+        '''
+        with self.lock:
+            future = self.groups.get(id)
+        return future is not None and future.done() and future.exception() is None and future.result()['status_code'] == 404
+
+    def add(self, id, details):
+        '''
+        Record a group created or updated by this run.
+
+        Parameters:
+            id      : The ID of the group
+            details : The group details
+        '''
+        future = concurrent.futures.Future()
+        future.set_result({'status_code':200, 'details':details})
+        with self.lock:
+            self.groups[id] = future
+
+    def discard(self, id):
+        '''
+        Forget a group deleted by this run.
+
+        Parameters:
+            id : The ID of the group
+        '''
+        with self.lock:
+            self.groups.pop(id, None)
+
+class TurbonomicClient:
+    '''
+    A client for the Turbonomic REST API.
+
+    The client owns a single requests.Session so that every call made
+    during a run reuses the same pooled, keep-alive connection (and TLS
+    session) to the Turbonomic server instead of opening a new one per
+    request. The authentication cookie is held on the session once the
+    user has logged in.
+    '''
+
+    def __init__(self, host, pool_size=DEFAULT_POOL_SIZE):
+        '''
+        Parameters:
+            host      : URL for the Turbonomic server
+            pool_size : Maximum number of connections kept open to the server
+        '''
+        self.host = host
+        self.user = None
+        self.password = None
+        self.cookie_cache = None
+        self.login_lock = threading.Lock()
+        self.login_attempted = False
+        self.workflow_index = WorkflowIndex()
+        self.resource_index = ResourceIndex()
+        self.group_resolver = GroupResolver()
+        self.ensure = False
+        self.retry_policy = RetryPolicy()
+        self.circuit_breaker = CircuitBreaker()
+        self.rate_limiter = None
+        self.shared_policy_lock = None
+        self.timeout = (CONNECT_TIMEOUT, DEFAULT_REQUEST_TIMEOUT)
+        self.page_size = DEFAULT_PAGE_SIZE
+        self.metrics = Metrics()
+        self.cassette = None
+        self.shared_session = False
+
+        requests.packages.urllib3.disable_warnings(category=requests.packages.urllib3.exceptions.InsecureRequestWarning)
+        self.session = requests.Session()
+        self.session.verify = False
+        self.session.headers.update({'Connection': 'keep-alive'})
+
+        self.mount_pool(pool_size)
+
+    def mount_pool(self, pool_size):
+        '''
+        Set the number of connections kept open to the server. A forked
+        client gets a session of its own first, with the authentication
+        cookie of the shared one, as other runs use the shared session.
+
+        Parameters:
+            pool_size : Maximum number of connections kept open to the server
+        '''
+        if self.shared_session:
+            session = requests.Session()
+            session.verify = self.session.verify
+            session.headers.update(self.session.headers)
+            self.session = session
+            self.shared_session = False
+
+        replaced = set(self.session.adapters.get(prefix) for prefix in ('https://', 'http://'))
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        if self.cassette is not None:
+            adapter = self.cassette.adapter(adapter)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # Close the connections of the pool that was replaced
+        for old_adapter in replaced:
+            if old_adapter is not None:
+                old_adapter.close()
+
+    def close(self):
+        '''
+        Close the pooled connections held by this client. The session of
+        a forked client that it still shares is left open.
+        '''
+        if not self.shared_session:
+            self.session.close()
+
+    def fork(self):
+        '''
+        Get a client for a new run that shares this client's pooled
+        connections, authentication cookie, workflow index, and circuit
+        breaker, but has its own resource index, group details, ensure
+        flag, and retry budget. A run that needs a different pool size
+        gets its own session. See mount_pool.
+
+        Returns:
+            A TurbonomicClient
+        '''
+        client = copy.copy(self)
+        client.shared_session = True
+        client.resource_index = ResourceIndex()
+        client.group_resolver = GroupResolver()
+        client.ensure = False
+        client.login_attempted = False
+        client.retry_policy = RetryPolicy(self.retry_policy.max_attempts, DEFAULT_RETRY_BUDGET)
+        return client
+
+    @property
+    def auth_cookie(self):
+        '''
+        The authentication cookie sent with each request, or None
+        '''
+        return self.session.headers.get('cookie')
+
+    def set_auth_cookie(self, auth_cookie):
+        '''
+        Use an authentication cookie for all subsequent requests.
+
+        Parameters:
+            auth_cookie : Authorization cookie
+        '''
+        if auth_cookie is None:
+            self.session.headers.pop('cookie', None)
+        else:
+            self.session.headers['cookie'] = auth_cookie
+
+    def request(self, method, path, **kwargs):
+        '''
+        Send a request to the Turbonomic REST API over the pooled session.
+
+        Parameters:
+            method : HTTP method
+            path   : API path relative to /api/v3, e.g. /groups
+            kwargs : Additional arguments passed to requests
+
+        Returns:
+            The requests.Response
+        '''
+        # Log in before the first request of a run
+        if self.auth_cookie is None and self.password is not None and not path.startswith('/login'):
+            self.ensure_authenticated()
+
+        auth_cookie = self.auth_cookie
+        response = self.send(method, path, **kwargs)
+
+        # The cookie expired or was revoked. Log in again and resend the request once.
+        if response.status_code == 401 and auth_cookie is not None and not path.startswith('/login'):
+            print_to_stderr('Authentication cookie was rejected. Logging in again.')
+            if self.relogin(auth_cookie) is not None:
+                response.close()
+                response = self.send(method, path, **kwargs)
+
+        return response
+
+    def send(self, method, path, **kwargs):
+        '''
+        Send a request, retrying transient failures as allowed by the retry
+        policy and failing fast while the circuit breaker is open.
+
+        Parameters:
+            method : HTTP method
+            path   : API path relative to /api/v3, e.g. /groups
+            kwargs : Additional arguments passed to requests
+
+        Returns:
+            The requests.Response
+        '''
+        kwargs.setdefault('timeout', self.timeout)
+        url = self.host + '/api/v3' + path
+
+        started = time.time()
+        attempt = 1
+        while True:
+            response = None
+            try:
+                self.circuit_breaker.before_request()
+                with self.rate_limiter.slot() if self.rate_limiter is not None else contextlib.nullcontext():
+                    response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if not isinstance(e, circuit_open_error()):
+                    self.circuit_breaker.record_failure()
+                if isinstance(e, circuit_open_error()) or not self.retry_policy.should_retry(method, attempt, error=e):
+                    self.metrics.record(method, path, type(e).__name__, 0, 0, time.time() - started, attempt - 1)
+                    raise
+                reason = type(e).__name__
+            else:
+                if response.status_code in (502, 503, 504):
+                    self.circuit_breaker.record_failure()
+                else:
+                    self.circuit_breaker.record_success()
+                if not self.retry_policy.should_retry(method, attempt, response=response):
+                    self.metrics.record(method, path, response.status_code, len(response.request.body or b''),
+                                        self._response_size(response, kwargs.get('stream', False), method, path),
+                                        time.time() - started, attempt - 1)
+                    return response
+                reason = 'Error ' + str(response.status_code)
+                response.close()
+
+            delay = self.retry_policy.delay(attempt, response)
+            print_to_stderr(reason + ' on ' + method + ' ' + path.split('?')[0] + '. Retrying in ' + '%.1f' % delay + ' seconds.')
+            time.sleep(delay)
+            attempt += 1
+
+    def _response_size(self, response, stream, method, path):
+        # A streamed body has not been read yet. Count it as it is read, since
+        # a chunked or replayed response has no Content-Length.
+        if not stream:
+            return len(response.content)
+
+        iter_content = response.iter_content
+        metrics = self.metrics
+        def counted_iter_content(*args, **kwargs):
+            for chunk in iter_content(*args, **kwargs):
+                metrics.add_bytes_received(method, path, len(chunk))
+                yield chunk
+        response.iter_content = counted_iter_content
+        return 0
+
+    def set_credentials(self, user, password, cookie_cache=None):
+        '''
+        Set the credentials the user logs in with. The login is deferred
+        until the first API call, so a run that makes no API calls never
+        logs in.
+
+        Parameters:
+            user         : Turbonomic user
+            password     : Turbonomic users password
+            cookie_cache : A CookieCache, or None to always log in
+        '''
+        self.user = user
+        self.password = password
+        self.cookie_cache = cookie_cache
+
+    def ensure_authenticated(self):
+        '''
+        Log in with the credentials given to set_credentials, unless this
+        client already has an authentication cookie or has tried to log in.
+        A failed login is not tried again for each request.
+        '''
+        with self.login_lock:
+            if self.auth_cookie is None and not self.login_attempted:
+                self.login_attempted = True
+                self.authenticate(self.user, self.password, self.cookie_cache)
+
+    def authenticate(self, user, password, cookie_cache=None):
+        '''
+        Get an authentication cookie, reusing a cached one when possible.
+
+        A cached cookie is checked with a cheap request before it is used.
+        If there is no valid cached cookie the user logs in and the new
+        cookie is cached. The cache lock is held throughout, so concurrent
+        processes wait for a single login rather than each logging in.
+
+        Parameters:
+            user         : Turbonomic user
+            password     : Turbonomic users password
+            cookie_cache : A CookieCache, or None to always log in
+
+        Returns:
+            An authentication cookie, or None if the login failed
+        '''
+        # Already logged in as this user, e.g. a client forked by the daemon
+        if self.auth_cookie is not None and self.user == user and self.password == password:
+            return self.auth_cookie
+
+        self.user = user
+        self.password = password
+        self.cookie_cache = cookie_cache
+
+        if cookie_cache is None:
+            return self.login(user, password)
+
+        with cookie_cache.lock():
+            auth_cookie = cookie_cache.get(self.host, user)
+            if auth_cookie is not None:
+                self.set_auth_cookie(auth_cookie)
+                if self.send('GET', '/users/me').status_code == 200:
+                    print_to_stderr('Reusing cached authentication cookie for user ' + user)
+                    return auth_cookie
+                print_to_stderr('Cached authentication cookie for user ' + user + ' is no longer valid')
+
+            auth_cookie = self.login(user, password)
+            cookie_cache.put(self.host, user, auth_cookie)
+
+        return auth_cookie
+
+    def relogin(self, rejected_cookie):
+        '''
+        Log in again after the server rejected a cookie.
+
+        Parameters:
+            rejected_cookie : The cookie that was rejected. If another thread
+                              has already replaced it the new cookie is used.
+
+        Returns:
+            An authentication cookie, or None if the login failed
+        '''
+        with self.login_lock:
+            if self.auth_cookie != rejected_cookie and self.auth_cookie is not None:
+                return self.auth_cookie
+
+            if self.cookie_cache is None:
+                return self.login(self.user, self.password)
+
+            with self.cookie_cache.lock():
+                auth_cookie = self.cookie_cache.get(self.host, self.user)
+                if auth_cookie is not None and auth_cookie != rejected_cookie:
+                    self.set_auth_cookie(auth_cookie)
+                    return auth_cookie
+
+                auth_cookie = self.login(self.user, self.password)
+                self.cookie_cache.put(self.host, self.user, auth_cookie)
+
+            return auth_cookie
+
+    def login(self, user, password):
+        '''
+        Log in and keep the authentication cookie for subsequent requests.
+
+        Parameters:
+            user     : Turbonomic user
+            password : Turbonomic users password
+
+        Returns:
+            An authentication cookie, or None if the login failed
+        '''
+        print_to_stderr('Authenticating user ' + user + ' against host ' + self.host)
+        auth_cookie = None
+
+        response = self.request('POST', '/login?username='+user+'&password='+password)
+        if response.status_code == 200:
+            auth_cookie = response.headers['set-cookie'].split(';')[0]
+        else:
+            print_to_stderr('Error ' + str(response.status_code) + ' authenticating user ' + user)
+
+        self.set_auth_cookie(auth_cookie)
+        return auth_cookie
+
+    def create_service(self, name, group_ids):
+        '''
+        Create a Turbonomic service.
+
+        Parameters:
+            name        : Service name
+            group_ids   : Comma separated list of groups to add to the service
+
+        Returns:
+            status_code : The HTTP status code for the request
+            id          : The ID of the service, if created, or None
+        '''
+        print_to_stderr('Creating service ' + name + ' in host ' + self.host)
+
+        existing = self.find_existing('services', 'Service', name)
+        if existing is not None:
+            return existing
+
+        id = None
+        vm_groups = []
+        db_server_groups = []
+
+        # Validate the groups to be added to this service
+        #   - Only 1 group of each type is supported
+        ids = [id for id in group_ids.split(',') if id != '']
+        groups = self.group_resolver.resolve(self, ids)
+        for id in ids:
+            response = groups[id]
+            if response['status_code'] != 200:
+                return {'status_code':response['status_code'], 'id':id}
+            type = response['details']['groupType']
+            if type == VIRTUAL_MACHINE:
+                vm_groups.append(id)
+            elif type == DATABASE_SERVER:
+                db_server_groups.append(id)
+            else:
+                print_to_stderr(type + ' groups can not be added to a service. Group ID ' + id + ' will be ignored')
+
+        # Impose restrictions on groups
+        if len(vm_groups) == 0 and len(db_server_groups) == 0:
+            print_to_stderr('At least one group must be added to a service')
+            return {'status_code':'400', 'id':id}
+
+        if len(vm_groups) > 1:
+            print_to_stderr('Only one VirtualMachine group can be added to a service')
+            return {'status_code':'400', 'id':id}
+
+        if len(db_server_groups) > 1:
+            print_to_stderr('Only one DatabaseServer group can be added to a service')
+            return {'status_code':'400', 'id':id}
+
+        body = build_service_body(name, vm_groups[0] if len(vm_groups) == 1 else None,
+                                  db_server_groups[0] if len(db_server_groups) == 1 else None)
+
+        return self.create_resource('services', 'Service', name, body)
+
+    def create_group(self, name, type, tag_name, tag_value):
+        '''
+        Create a Turbonomic group (VirtualMachine, Database, or DatabaseServer).
+
+        Parameters:
+            name        : Group name
+            type        : Group type - VirtualMachine, Database, or DatabaseServer
+            tag_name    : Tag name to find resources to include in this group
+            tag_value   : Tag value to find resources to include in this group
+
+        Returns:
+            status_code : The HTTP status code for the request
+            id          : The ID of the group, if created, or None
+        '''
+        print_to_stderr('Creating group ' + name + ' with type ' + type + ' in host ' + self.host)
+
+        id = None
+
+        # Validate group type
+        if type != VIRTUAL_MACHINE and type != DATABASE and type != DATABASE_SERVER:
+            print_to_stderr('The specified group type "' + type +'" is not valid. Valid values are ' + VIRTUAL_MACHINE + ', ' + DATABASE + ', and ' + DATABASE_SERVER)
+            return {'status_code':'400', 'id':id}
+
+        existing = self.find_existing('groups', 'Group', name)
+        if existing is not None:
+            return existing
+
+        body = build_group_body(name, type, tag_name, tag_value)
+        return self.create_resource('groups', 'Group', name, body)
+
+    def create_ia_vm_scale_policy(self, name, group_ids):
+        '''
+        Create a Turbonomic virtual machine policy and add it to a group.
+
+        Parameters:
+            name        : Policy name
+            group_ids   : Comma separated list of groups to which this policy will be added
+
+        Returns:
+            status_code : The HTTP status code for the request
+            id          : The ID of the policy, if created, or None
+        '''
+        print_to_stderr('Creating virtual machine policy "' + name + '" in host ' + self.host)
+
+        existing = self.find_existing('policies', 'Virtual machine policy', name)
+        if existing is not None:
+            return existing
+
+        # Get the workflow ID for the custom virtual machine scale action
+        ia_scale_action_workflow_id = self.get_workflow(ia_workflow_name, 'VIRTUAL_MACHINE', 'SCALE')
+        if ia_scale_action_workflow_id is None:
+            return {'status_code':404}
+
+        # Get the groups (scope) to which this policy is to be added
+        scope_ids = []
+        if group_ids is not None:
+            scope_ids = group_ids.split(',')
+
+        error = self.check_policy_scope(scope_ids)
+        if error is not None:
+            return error
+
+        body = build_ia_vm_scale_policy_body(name, ia_scale_action_workflow_id, scope_ids)
+        print_to_stderr('body for create policy REST API')
+        print_to_stderr(json.dumps(body))
+
+        return self.create_resource('policies', 'Virtual machine policy', name, body)
+
+    def check_policy_scope(self, group_ids):
+        '''
+        Check that the scope of a virtual machine policy has only existing VirtualMachine groups.
+
+        Parameters:
+            group_ids : List of group IDs
+
+        Returns:
+            None if the scope is valid, or else
+            status_code : The HTTP status code for the group, or 400 if it is not a VirtualMachine group
+            id          : The ID of the group
+        '''
+        groups = self.group_resolver.resolve(self, [id for id in group_ids if id != ''])
+        for id, response in groups.items():
+            if response['status_code'] != 200:
+                return {'status_code':response['status_code'], 'id':id}
+            if response['details'].get('groupType') != VIRTUAL_MACHINE:
+                print_to_stderr(str(response['details'].get('groupType')) + ' group ' + id + ' can not be in the scope of a virtual machine policy')
+                return {'status_code':'400', 'id':id}
+        return None
+
+    def update_shared_policy(self, name, group_ids, attach=True):
+        '''
+        Add groups to, or remove them from, the scope of an IA scale action
+        policy shared by many services, instead of having one policy per
+        service.
+
+        The scope is read, changed, and written back with a PUT, then read
+        again to confirm the change. A conflicting or lost update is retried.
+        The policy is created when groups are added to a policy that does
+        not exist, and deleted when the last group is removed.
+
+        The update is not atomic. Processes on this host update the policy
+        one at a time, but the PUT sends no version, so a process on another
+        host that changes the scope between the read and the PUT has its
+        change overwritten. The confirming read only detects updates of this
+        process that were lost.
+
+        Parameters:
+            name      : Name of the shared policy
+            group_ids : Comma separated list of groups
+            attach    : True to add the groups to the scope, False to remove them
+
+        Returns:
+            status_code : The HTTP status code for the request, or 404 if
+                          groups are removed from a policy that does not exist
+            id          : The ID of the policy, or None
+        '''
+        ids = split_ids(group_ids)
+        print_to_stderr(('Adding groups to' if attach else 'Removing groups from') + ' shared policy "' + name + '" in host ' + self.host)
+
+        workflow_id = self.get_workflow(ia_workflow_name, 'VIRTUAL_MACHINE', 'SCALE')
+        if workflow_id is None:
+            return {'status_code':404, 'id':None}
+
+        if attach:
+            error = self.check_policy_scope(ids)
+            if error is not None:
+                return error
+
+        id = None
+        lock = host_lock(self.shared_policy_lock) if self.shared_policy_lock is not None else contextlib.nullcontext()
+        with lock:
+            # The last pass only reads the scope, to confirm the update of the attempt before it
+            for attempt in range(SHARED_POLICY_ATTEMPTS + 1):
+                id = self.resource_index.find(self, 'policies', name)
+                if id is None and not attach:
+                    print_to_stderr('Shared policy ' + name + ' does not exist')
+                    return {'status_code':404, 'id':None}
+
+                if id is None and attempt == SHARED_POLICY_ATTEMPTS:
+                    break
+
+                if id is None:
+                    status = self.create_resource('policies', 'Virtual machine policy', name,
+                                                  build_ia_vm_scale_policy_body(name, workflow_id, ids))
+                    if status['status_code'] not in CONFLICT_STATUS_CODES:
+                        return status
+                    print_to_stderr('Shared policy ' + name + ' was created by another process. Trying again.')
+                    time.sleep(random.uniform(0, SHARED_POLICY_RETRY_DELAY))
+                    self.resource_index.reset('policies')
+                    continue
+
+                response = self.request('GET', RESOURCE_PATHS['policies'] + '/' + id)
+                if response.status_code == 404:
+                    # Deleted since the policy list was read
+                    self.resource_index.discard(id)
+                    continue
+                if response.status_code != 200:
+                    print_to_stderr('Error ' + str(response.status_code) + ' getting shared policy ' + name)
+                    print_to_stderr('response.txt: ' + response.text)
+                    return {'status_code':response.status_code, 'id':id}
+
+                scope_ids = [scope['uuid'] for scope in response.json().get('scopes') or []]
+                if attach:
+                    new_scope_ids = scope_ids + [group_id for group_id in ids if group_id not in scope_ids]
+                else:
+                    new_scope_ids = [scope_id for scope_id in scope_ids if scope_id not in ids]
+
+                if new_scope_ids == scope_ids:
+                    print_to_stderr('The scope of shared policy ' + name + ' is up to date')
+                    return {'status_code':200, 'id':id}
+
+                if attempt == SHARED_POLICY_ATTEMPTS:
+                    break
+
+                if len(new_scope_ids) == 0:
+                    status_code = self.delete_resource(RESOURCE_PATHS['policies'], 'Policy', id)
+                    return {'status_code':200 if status_code == 404 else status_code, 'id':id}
+
+                status = self.update_resource('policies', 'Virtual machine policy', name, id,
+                                              build_ia_vm_scale_policy_body(name, workflow_id, new_scope_ids))
+                if status['status_code'] in CONFLICT_STATUS_CODES:
+                    print_to_stderr('The scope of shared policy ' + name + ' was changed by another process. Trying again.')
+                    time.sleep(random.uniform(0, SHARED_POLICY_RETRY_DELAY))
+                elif status['status_code'] != 200:
+                    return status
+
+                # Read the scope again to confirm the update was not overwritten
+
+        print_to_stderr('The scope of shared policy ' + name + ' could not be updated after ' + str(SHARED_POLICY_ATTEMPTS) + ' attempts')
+        return {'status_code':'409', 'id':id}
+
+    def create_resource(self, kind, resource_type, name, body):
+        '''
+        Create a Turbonomic resource from a request body.
+
+        Parameters:
+            kind          : groups, services, or policies
+            resource_type : The resource type. Used for logging.
+            name          : The display name
+            body          : The JSON request body
+
+        Returns:
+            status_code : The HTTP status code for the request
+            id          : The ID of the resource, if created, or None
+        '''
+        id = None
+
+        response = self.request('POST', RESOURCE_PATHS[kind], json=body)
+        if response.status_code == 200:
+            details = response.json()
+            id = details['uuid']
+            self.resource_index.add(kind, name, id)
+            if kind == 'groups':
+                self.group_resolver.add(id, dict(body, **details))
+            print_to_stderr(resource_type + ' ' + name + ' with id ' + id + ' was created successfully')
+        else:
+            print_to_stderr('Error ' + str(response.status_code) + ' creating ' + resource_type.lower() + ' ' + name)
+            print_to_stderr('response.txt: ' + response.text)
+
+        return {'status_code':response.status_code, 'id':id}
+
+    def update_resource(self, kind, resource_type, name, id, body):
+        '''
+        Replace a Turbonomic resource with a new request body.
+
+        Parameters:
+            kind          : groups, services, or policies
+            resource_type : The resource type. Used for logging.
+            name          : The display name
+            id            : The ID of the resource
+            body          : The JSON request body
+
+        Returns:
+            status_code : The HTTP status code for the request
+            id          : The ID of the resource
+        '''
+        response = self.request('PUT', RESOURCE_PATHS[kind] + '/' + id, json=body)
+        if response.status_code == 200:
+            if kind == 'groups':
+                self.group_resolver.discard(id)
+            print_to_stderr(resource_type + ' ' + name + ' with id ' + id + ' was updated successfully')
+        else:
+            print_to_stderr('Error ' + str(response.status_code) + ' updating ' + resource_type.lower() + ' ' + name)
+            print_to_stderr('response.txt: ' + response.text)
+
+        return {'status_code':response.status_code, 'id':id}
+
+    def find_existing(self, kind, resource_type, name):
+        '''
+        In ensure mode, find a resource that already exists so it is not created again.
+
+        Parameters:
+            kind          : groups, services, or policies
+            resource_type : The resource type. Used for logging.
+            name          : The display name
+
+        Returns:
+            status_code : 200
+            id          : The ID of the existing resource
+            or None if not in ensure mode or the resource does not exist
+        '''
+        if not self.ensure:
+            return None
+
+        id = self.resource_index.find(self, kind, name)
+        if id is None:
+            return None
+
+        print_to_stderr(resource_type + ' ' + name + ' already exists with id ' + id)
+        return {'status_code':200, 'id':id}
+
+    def iter_resources(self, path, description):
+        '''
+        Get every resource in a list, one page at a time. The next page is
+        requested while the caller works through the current one, and each
+        page is parsed as it arrives, so the whole list is never held in
+        memory and a caller that stops early does not download the rest.
+
+        Parameters:
+            path        : API path of the list, e.g. /groups
+            description : What is listed. Used for logging.
+
+        Returns:
+            A generator of resource details. It raises ListError if a page could not be downloaded.
+        '''
+        print_to_stderr('Getting the list of ' + description)
+
+        executor = ContextThreadPoolExecutor(max_workers=1)
+        page = executor.submit(self.get_page, path, None)
+        cursor = None
+        try:
+            while page is not None:
+                response = page.result()
+                page = None
+                try:
+                    if response.status_code != 200:
+                        print_to_stderr('Error ' + str(response.status_code) + ' getting the list of ' + description)
+                        print_to_stderr('response.txt: ' + response.text)
+                        raise ListError(response.status_code)
+
+                    next_cursor = response.headers.get('X-Next-Cursor')
+                    if next_cursor and next_cursor != cursor:
+                        cursor = next_cursor
+                        page = executor.submit(self.get_page, path, cursor)
+
+                    yield from iter_json_array(response.iter_content(LIST_CHUNK_SIZE))
+                finally:
+                    response.close()
+        finally:
+            # Stopped early. Release the connection of a page that was prefetched but not read.
+            if page is not None and not page.cancel():
+                page.add_done_callback(lambda future: future.exception() is None and future.result().close())
+            executor.shutdown(wait=False)
+
+    def get_page(self, path, cursor):
+        '''
+        Request one page of a list. The body is read as it is consumed.
+
+        Parameters:
+            path   : API path of the list, e.g. /groups
+            cursor : The X-Next-Cursor of the previous page, or None for the first page
+
+        Returns:
+            The requests.Response
+        '''
+        params = {'limit': self.page_size}
+        if cursor is not None:
+            params['cursor'] = cursor
+        return self.request('GET', path, params=params, stream=True)
+
+    def get_workflow(self, name, entity_type, action_type):
+        '''
+        Get the ID for a Turbonomic workflow.
+
+        Parameters:
+            name        : The workflow display name
+            entity_type : The workflow entity type
+            action_type : The workflow action type
+
+        Returns:
+            workflow_id : The ID of the workflow, if found, or None
+        '''
+        print_to_stderr('Getting details for workflow with displayName ' + name + ' entity_type ' + entity_type + ' action_type ' + action_type)
+
+        index = self.workflow_index
+        with index.lock:
+            workflow_id = None if index.is_stale() else index.find(name, entity_type, action_type)
+
+            # The index is out of date or partial, or the workflow may have been added since it was built
+            if workflow_id is None and not (index.refreshed and index.complete):
+                if not self.refresh_workflow_index((name, entity_type, action_type)):
+                    return None
+                workflow_id = index.find(name, entity_type, action_type)
+
+        if workflow_id is None:
+            print_to_stderr('Workflow with displayName ' + name + ' does not exist')
+        else:
+            print_to_stderr('Workflow ' + name + ' was found')
+
+        return workflow_id
+
+    def refresh_workflow_index(self, stop_at=None):
+        '''
+        Download the workflow list and rebuild the workflow index.
+
+        Parameters:
+            stop_at : The (name, entity type, action type) being looked up, or None. See WorkflowIndex.update.
+
+        Returns:
+            True if the index was rebuilt, or False if the download failed
+        '''
+        try:
+            with contextlib.closing(self.iter_resources('/workflows', 'workflows')) as workflows:
+                self.workflow_index.update(workflows, stop_at)
+        except ListError:
+            return False
+
+        return True
+
+    def get_group(self, id):
+        '''
+        Get details for a Turbonomic group.
+
+        Parameters:
+            id          : The ID of the group
+
+        Returns:
+            status_code : The HTTP status code for the request
+            details     : The group details
+        '''
+        print_to_stderr('Getting details for group with id ' + id)
+
+        details = None
+
+        response = self.request('GET', '/groups/'+id)
+        if response.status_code == 200:
+            details = response.json()
+        else:
+            print_to_stderr('Error ' + str(response.status_code) + ' getting group with id ' + id)
+            print_to_stderr('response.txt: ' + response.text)
+
+        return {'status_code':response.status_code, 'details':details}
+
+    def check_resource(self, kind, id):
+        '''
+        Check whether a resource exists.
+
+        Parameters:
+            kind : groups, services, or policies
+            id   : The ID of the resource
+
+        Returns:
+            status_code : 200 if the resource exists, 404 if it does not, or
+                          another status code or error if that is not known
+        '''
+        try:
+            return self.request('GET', RESOURCE_PATHS[kind] + '/' + id).status_code
+        except requests.exceptions.RequestException as e:
+            return str(e)
+
+    def delete_group(self, id):
+        '''
+        Delete a Turbonomic group.
+
+        Parameters:
+            id          : The ID of the group to delete
+
+        Returns:
+            status_code : The HTTP status code for the request
+        '''
+        print_to_stderr('Deleting group with id ' + id)
+        return self.delete_resource('/groups', 'Group', id)
+
+    def delete_service(self, id):
+        '''
+        Delete a Turbonomic service.
+
+        Parameters:
+            id          : The ID of the service to delete
+
+        Returns:
+            status_code : The HTTP status code for the request
+        '''
+        print_to_stderr('Deleting service with id ' + id)
+        return self.delete_resource('/topologydefinitions', 'Service', id)
+
+    def delete_policy(self, id):
+        '''
+        Delete a Turbonomic policy.
+
+        Parameters:
+            id          : The ID of the policy to delete
+
+        Returns:
+            status_code : The HTTP status code for the request
+        '''
+
+        print_to_stderr('Deleting policy with id ' + id)
+        return self.delete_resource('/settingspolicies', 'Policy', id)
+
+    def delete_resource(self, path, resource_type, id, retry_on_500=True):
+        '''
+        Delete a Turbonomic resource.
+
+        Parameters:
+            path          : Turbonomic REST API path, e.g. /groups
+            resource_type : The resource type to delete. Used for logging.
+            id            : The ID of the resource to delete
+            retry_on_500  : Delete again after a status code 500. See below.
+
+        Returns:
+            status_code : The HTTP status code for the request
+        '''
+        path = path + '/' + id
+
+        try_again = True
+        attempted = 1
+        while try_again:
+            try_again = False
+            response = self.request('DELETE', path)
+            if response.status_code == 200:
+                self.resource_index.discard(id)
+                self.group_resolver.discard(id)
+                print_to_stderr(resource_type + ' with id ' + id + ' was deleted successfully')
+            elif response.status_code == 404:
+                self.resource_index.discard(id)
+                self.group_resolver.discard(id)
+                print_to_stderr(resource_type + ' with id ' + id + ' does not exist')
+            else:
+                # There is a race condition when deleting a service. If a group in the service
+                # is deleted while the service is being deleted you may get a status code
+                # 500 and the service is not deleted. To avoid any race conditions, attempt to
+                # delete the resource a second time. delete_resources_async instead checks
+                # which resources are still there and deletes only those again.
+                if response.status_code == 500 and attempted == 1 and retry_on_500:
+                    print_to_stderr('Error 500 while deleting a ' + resource_type + ' with id ' + id + '. Try again.')
+                    attempted += 1
+                    try_again = True
+                else:
+                    print_to_stderr('Error ' + str(response.status_code) + ' deleting ' + resource_type + ' with id ' + id)
+                    print_to_stderr('response.txt: ' + response.text)
+
+        return response.status_code
+
+#####################################################################
+# Manifest (batch) provisioning                                     #
+#####################################################################
+DEFAULT_WORKERS = 4
+
+# Keys used for the combined ids in the manifest results
+MANIFEST_RESULT_KEYS = {'groups': 'group_id', 'services': 'service_id', 'policies': 'policy_id'}
+
+def normalize_group_type(group_type):
+    '''
+    Map a case insensitive group type to the Turbonomic group type.
+
+    Parameters:
+        group_type : Group type - VirtualMachine, Database, or DatabaseServer in any case
+
+    Returns:
+        The Turbonomic group type, or None if the group type is not valid
+    '''
+    for valid_type in (VIRTUAL_MACHINE, DATABASE, DATABASE_SERVER):
+        if group_type.lower() == valid_type.lower():
+            return valid_type
+    return None
+
+def load_manifest(path):
+    '''
+    Read a manifest file and build the list of steps needed to create
+    the resources in it. See build_manifest_steps.
+
+    Parameters:
+        path : Path to the manifest file
+
+    Returns:
+        A list of steps, or None if the manifest is not valid
+    '''
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print_to_stderr('Error reading manifest ' + path + ': ' + str(e))
+        return None
+
+    return build_manifest_steps(manifest)
+
+def build_manifest_steps(manifest):
+    '''
+    Build the list of steps needed to create the groups, services, and
+    policies in a manifest.
+
+    The manifest is a JSON document of the form:
+
+        {
+          "groups":   [{"key": "vm_group", "name": "...", "type": "VirtualMachine",
+                        "tag_name": "...", "tag_value": "..."}],
+          "services": [{"key": "service", "name": "...", "groups": ["vm_group"]}],
+          "policies": [{"key": "vm_policy", "name": "...", "groups": ["vm_group"]}]
+        }
+
+    Entries in the "groups" list of a service or policy are either the
+    key of a group in the manifest or the ID of an existing group.
+
+    An entry with "absent": true describes a resource that --reconcile
+    deletes if it exists. It only needs a key and a name.
+
+    Parameters:
+        manifest : The manifest
+
+    Returns:
+        A list of steps, or None if the manifest is not valid. Each step has
+            key        : The manifest key of the resource
+            kind       : groups, services, or policies
+            spec       : The manifest entry
+            depends_on : Keys of the manifest groups this step needs
+    '''
+    required = {
+                   'groups':   ['key', 'name', 'type', 'tag_name', 'tag_value'],
+                   'services': ['key', 'name', 'groups'],
+                   'policies': ['key', 'name', 'groups']
+               }
+
+    steps = []
+    keys = set()
+    error = False
+    for kind in ('groups', 'services', 'policies'):
+        for spec in manifest.get(kind, []):
+            absent = spec.get('absent', False)
+            missing = [field for field in (['key', 'name'] if absent else required[kind]) if field not in spec]
+            if len(missing) > 0:
+                print_to_stderr('Syntax error: manifest ' + kind + ' entry ' + json.dumps(spec) + ' is missing ' + ', '.join(missing))
+                error = True
+                continue
+
+            key = spec['key']
+            if key in keys or key in MANIFEST_RESULT_KEYS.values():
+                print_to_stderr('Syntax error: manifest key "' + key + '" is not unique')
+                error = True
+                continue
+            keys.add(key)
+
+            if kind == 'groups' and not absent:
+                spec = dict(spec)
+                spec['type'] = normalize_group_type(spec['type'])
+                if spec['type'] is None:
+                    print_to_stderr('Syntax error: manifest group "' + key + '" has a group type that is not valid. Valid values are ' + VIRTUAL_MACHINE + ', ' + DATABASE + ', and ' + DATABASE_SERVER)
+                    error = True
+                    continue
+
+            steps.append({'key': key, 'kind': kind, 'spec': spec, 'depends_on': []})
+
+    group_keys = set(step['key'] for step in steps if step['kind'] == 'groups')
+    absent_keys = set(step['key'] for step in steps if step['spec'].get('absent', False))
+    for step in steps:
+        if step['kind'] != 'groups' and not step['spec'].get('absent', False):
+            step['depends_on'] = [ref for ref in step['spec']['groups'] if ref in group_keys]
+            for ref in step['depends_on']:
+                if ref in absent_keys:
+                    print_to_stderr('Syntax error: manifest entry "' + step['key'] + '" refers to absent group "' + ref + '"')
+                    error = True
+
+    if error:
+        return None
+
+    return steps
+
+def run_manifest_step(client, step, results):
+    '''
+    Create the resource for one manifest step.
+
+    Parameters:
+        client  : A logged in TurbonomicClient
+        step    : The step to run
+        results : Results of the steps already run, keyed by manifest key
+
+    Returns:
+        status_code : The HTTP status code for the request, or the error if it could not be sent
+        id          : The ID of the resource, if created, or None
+    '''
+    spec = step['spec']
+    try:
+        if step['kind'] == 'groups':
+            return client.create_group(spec['name'], spec['type'], spec['tag_name'], spec['tag_value'])
+
+        group_ids = ','.join(results[ref]['id'] if ref in results else ref for ref in spec['groups'])
+        if step['kind'] == 'services':
+            return client.create_service(spec['name'], group_ids)
+        return client.create_ia_vm_scale_policy(spec['name'], group_ids)
+    except requests.exceptions.RequestException as e:
+        print_to_stderr('Error creating ' + step['key'] + ': ' + str(e))
+        return {'status_code':str(e), 'id':None}
+
+def run_manifest(client, steps, max_workers=DEFAULT_WORKERS, journal=None):
+    '''
+    Run manifest steps, starting each step as soon as the groups it
+    depends on have been created. Independent steps, such as the groups,
+    run concurrently.
+
+    Parameters:
+        client      : A logged in TurbonomicClient
+        steps       : The steps returned by load_manifest
+        max_workers : Maximum number of steps to run at the same time
+        journal     : The Journal of steps completed by earlier runs, or None
+
+    Returns:
+        The result of each step, keyed by manifest key. A step whose
+        request could not be sent has the error as its status code. Steps
+        that depend on a failed step are not run and have status code 424.
+    '''
+    journal = journal or Journal()
+    results = {}
+    pending = {step['key']: step for step in steps}
+    running = {}
+
+    with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+        while len(pending) > 0 or len(running) > 0:
+            for key, step in list(pending.items()):
+                failed = [dep for dep in step['depends_on'] if dep in results and results[dep]['status_code'] != 200]
+                if len(failed) > 0:
+                    print_to_stderr('Skipping ' + key + ' because ' + ', '.join(failed) + ' could not be created')
+                    results[key] = {'status_code':'424', 'id':None}
+                    del pending[key]
+                elif all(dep in results for dep in step['depends_on']):
+                    results[key] = journal.get(key)
+                    if results[key] is None:
+                        del results[key]
+                        running[executor.submit(run_manifest_step, client, step, results)] = key
+                    del pending[key]
+
+            if len(running) == 0:
+                continue
+
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                key = running.pop(future)
+                results[key] = future.result()
+                journal.record(key, results[key])
+
+    return results
+
+def manifest_return_data(steps, results):
+    '''
+    Build the data returned to the camc_scriptpackage resource for a manifest run.
+
+    Parameters:
+        steps   : The steps returned by load_manifest
+        results : The results returned by run_manifest
+
+    Returns:
+        A map with the ID of each resource keyed by manifest key, and the
+        comma separated IDs of all groups, services, and policies under
+        group_id, service_id, and policy_id
+    '''
+    return_data = {}
+    for kind, result_key in MANIFEST_RESULT_KEYS.items():
+        ids = [results[step['key']]['id'] for step in steps if step['kind'] == kind and results[step['key']]['status_code'] == 200]
+        return_data[result_key] = ','.join(id for id in ids if id is not None) or None
+
+    for step in steps:
+        result = results[step['key']]
+        return_data[step['key']] = result['id'] if result['status_code'] == 200 else None
+
+    return return_data
+
+#####################################################################
+# Plan and reconcile                                                #
+#####################################################################
+
+# Resource type of each kind. Used for logging.
+RESOURCE_TYPES = {'groups': 'Group', 'services': 'Service', 'policies': 'Virtual machine policy'}
+
+def comparable_fields(kind, resource, setting_keys=None):
+    '''
+    Get the fields of a group, service, or policy that are compared
+    between the desired and actual state, in a normalized form.
+
+    Parameters:
+        kind         : groups, services, or policies
+        resource     : A request body or the resource details returned by Turbonomic
+        setting_keys : For policies, only compare these settings. Turbonomic may
+                       return settings that this script does not manage.
+
+    Returns:
+        A map of field name to normalized value
+    '''
+    if kind == 'groups':
+        criteria = [[c.get('filterType'), c.get('expType'), c.get('expVal'), c.get('caseSensitive', False)]
+                    for c in resource.get('criteriaList') or []]
+        return {
+                   'groupType':    resource.get('groupType'),
+                   'isStatic':     resource.get('isStatic'),
+                   'criteriaList': sorted(criteria, key=str)
+               }
+
+    if kind == 'services':
+        connections = (resource.get('entityDefinitionData') or {}).get('manualConnectionData') or {}
+        return {
+                   'entityType':           resource.get('entityType'),
+                   'manualConnectionData': {type: (c.get('connectedGroup') or {}).get('uuid') for type, c in connections.items()}
+               }
+
+    settings = {}
+    for manager in resource.get('settingsManagers') or []:
+        for setting in manager.get('settings') or []:
+            key = manager.get('uuid') + '/' + setting.get('uuid')
+            if setting_keys is None or key in setting_keys:
+                settings[key] = str(setting.get('value')).lower()
+    return {
+               'entityType':       resource.get('entityType'),
+               'disabled':         resource.get('disabled'),
+               'scopes':           sorted(scope.get('uuid') for scope in resource.get('scopes') or []),
+               'settingsManagers': settings
+           }
+
+def diff_resource(kind, desired, actual):
+    '''
+    Compare a request body with the existing resource field by field.
+
+    Parameters:
+        kind    : groups, services, or policies
+        desired : The request body that would create the resource
+        actual  : The resource details returned by Turbonomic
+
+    Returns:
+        A list of the names of the fields that differ
+    '''
+    desired_fields = comparable_fields(kind, desired)
+    actual_fields = comparable_fields(kind, actual, desired_fields.get('settingsManagers'))
+    return [field for field in desired_fields if desired_fields[field] != actual_fields.get(field)]
+
+def desired_body(client, step, results, group_types):
+    '''
+    Build the request body that would create the resource for a manifest step.
+
+    Parameters:
+        client      : A logged in TurbonomicClient
+        step        : The manifest step
+        results     : Results of the group steps, keyed by manifest key
+        group_types : Group type of each manifest group, keyed by manifest key
+
+    Returns:
+        The JSON request body, or None if it can not be built
+    '''
+    spec = step['spec']
+    if step['kind'] == 'groups':
+        return build_group_body(spec['name'], spec['type'], spec['tag_name'], spec['tag_value'])
+
+    group_ids = []
+    groups = client.group_resolver.resolve(client, [ref for ref in spec['groups'] if ref not in group_types])
+    for ref in spec['groups']:
+        if ref in group_types:
+            group_ids.append((results[ref]['id'], group_types[ref]))
+        else:
+            response = groups[ref]
+            if response['status_code'] != 200:
+                return None
+            group_ids.append((ref, response['details']['groupType']))
+
+    if step['kind'] == 'policies':
+        workflow_id = client.get_workflow(ia_workflow_name, 'VIRTUAL_MACHINE', 'SCALE')
+        if workflow_id is None:
+            return None
+        return build_ia_vm_scale_policy_body(spec['name'], workflow_id, [id for id, type in group_ids])
+
+    # The same restrictions as create_service
+    vm_groups = [id for id, type in group_ids if type == VIRTUAL_MACHINE]
+    db_server_groups = [id for id, type in group_ids if type == DATABASE_SERVER]
+    if len(vm_groups) > 1 or len(db_server_groups) > 1 or len(vm_groups) + len(db_server_groups) == 0:
+        print_to_stderr('Service ' + spec['name'] + ' needs at most one VirtualMachine and one DatabaseServer group, and at least one of them')
+        return None
+
+    return build_service_body(spec['name'], vm_groups[0] if len(vm_groups) == 1 else None,
+                              db_server_groups[0] if len(db_server_groups) == 1 else None)
+
+def plan_step(client, step, actual, results, group_types):
+    '''
+    Decide what must be done to make one resource match the manifest.
+
+    Parameters:
+        client      : A logged in TurbonomicClient
+        step        : The manifest step
+        actual      : Existing resources by kind, keyed by display name
+        results     : Results of the group steps, keyed by manifest key
+        group_types : Group type of each manifest group, keyed by manifest key
+
+    Returns:
+        A plan entry with
+            key     : The manifest key
+            kind    : groups, services, or policies
+            name    : The display name
+            id      : The ID of the existing resource, or None
+            action  : create, update, delete, none, skip (a dependency failed), or error
+            changes : The fields that differ, for an update
+        and the request body for a create or update, or None
+    '''
+    spec = step['spec']
+    existing = actual[step['kind']].get(spec['name'])
+    entry = {'key': step['key'], 'kind': step['kind'], 'name': spec['name'],
+             'id': existing['uuid'] if existing is not None else None, 'action': 'none', 'changes': []}
+
+    if spec.get('absent', False):
+        if existing is not None:
+            entry['action'] = 'delete'
+        return entry, None
+
+    failed = [dep for dep in step['depends_on'] if results[dep]['status_code'] != 200]
+    if len(failed) > 0:
+        print_to_stderr('Skipping ' + step['key'] + ' because ' + ', '.join(failed) + ' could not be created')
+        entry['action'] = 'skip'
+        return entry, None
+
+    try:
+        body = desired_body(client, step, results, group_types)
+    except requests.exceptions.RequestException as e:
+        print_to_stderr('Error planning ' + step['key'] + ': ' + str(e))
+        body = None
+    if body is None:
+        entry['action'] = 'error'
+    elif existing is None:
+        entry['action'] = 'create'
+    else:
+        entry['changes'] = diff_resource(step['kind'], body, existing)
+        if len(entry['changes']) > 0:
+            entry['action'] = 'update'
+
+    return entry, body
+
+def apply_plan_entry(client, entry, body):
+    '''
+    Issue the POST or PUT for a plan entry.
+
+    Parameters:
+        client : A logged in TurbonomicClient
+        entry  : The plan entry
+        body   : The request body for a create or update
+
+    Returns:
+        status_code : The HTTP status code for the request, or the error if it could not be sent
+        id          : The ID of the resource
+    '''
+    resource_type = RESOURCE_TYPES[entry['kind']]
+    try:
+        if entry['action'] == 'create':
+            return client.create_resource(entry['kind'], resource_type, entry['name'], body)
+        if entry['action'] == 'update':
+            return client.update_resource(entry['kind'], resource_type, entry['name'], entry['id'], body)
+    except requests.exceptions.RequestException as e:
+        print_to_stderr('Error applying ' + entry['action'] + ' of ' + entry['key'] + ': ' + str(e))
+        return {'status_code':str(e), 'id':entry['id']}
+    if entry['action'] == 'skip':
+        return {'status_code':'424', 'id':None}
+    if entry['action'] == 'error':
+        return {'status_code':'400', 'id':None}
+    return {'status_code':200, 'id':entry['id']}
+
+def existing_resources(client, kind, names):
+    '''
+    Get the existing resources of a kind that have one of the given names.
+    Only the matching resources are kept as the list is read.
+
+    Parameters:
+        client : A logged in TurbonomicClient
+        kind   : groups, services, or policies
+        names  : The display names
+
+    Returns:
+        The resource details keyed by display name, or None if the list could not be downloaded
+    '''
+    resources = {}
+    try:
+        for resource in client.iter_resources(RESOURCE_PATHS[kind], kind):
+            if resource.get('displayName') in names:
+                resources.setdefault(resource['displayName'], resource)
+    except ListError:
+        return None
+    except requests.exceptions.RequestException as e:
+        print_to_stderr('Error getting the list of ' + kind + ': ' + str(e))
+        return None
+
+    return resources
+
+def reconcile_manifest(client, steps, apply=False, max_workers=DEFAULT_WORKERS):
+    '''
+    Compare the manifest with the groups, services, and policies that
+    exist in Turbonomic and, if apply is True, issue only the POST, PUT,
+    and DELETE requests needed to make them match.
+
+    The existing resources are read with one paginated list per kind.
+    Groups are planned (and applied) first, then services and policies,
+    then absent resources are deleted.
+
+    Parameters:
+        client      : A logged in TurbonomicClient
+        steps       : The steps returned by build_manifest_steps
+        apply       : True to make the changes, False to only plan them
+        max_workers : Maximum number of requests to run at the same time
+
+    Returns:
+        plan    : The plan entries. See plan_step.
+        results : The result of each step, keyed by manifest key, or None if
+                  the existing resources could not be read
+    '''
+    with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+        kinds = list(RESOURCE_PATHS)
+        names = [set(step['spec']['name'] for step in steps if step['kind'] == kind) for kind in kinds]
+        actual = dict(zip(kinds, executor.map(functools.partial(existing_resources, client), kinds, names)))
+        if any(resources is None for resources in actual.values()):
+            return [], None
+
+        group_types = {step['key']: step['spec']['type'] for step in steps
+                       if step['kind'] == 'groups' and not step['spec'].get('absent', False)}
+        plan = []
+        results = {}
+
+        for tier in (['groups'], ['services', 'policies']):
+            tier_plan = []
+            for step in steps:
+                if step['kind'] in tier and not step['spec'].get('absent', False):
+                    tier_plan.append(plan_step(client, step, actual, results, group_types))
+            plan.extend(entry for entry, body in tier_plan)
+
+            if apply:
+                futures = {executor.submit(apply_plan_entry, client, entry, body): entry for entry, body in tier_plan}
+                for future in concurrent.futures.as_completed(futures):
+                    results[futures[future]['key']] = future.result()
+            else:
+                # Stand in for the result. A group that would be created is referred to by its key.
+                for entry, body in tier_plan:
+                    status_code = {'skip': '424', 'error': '400'}.get(entry['action'], 200)
+                    results[entry['key']] = {'status_code':status_code, 'id':entry['id'] or '<' + entry['key'] + '>'}
+
+    absent = [plan_step(client, step, actual, results, group_types)[0] for step in steps if step['spec'].get('absent', False)]
+    plan.extend(absent)
+
+    delete_ids = {kind: ','.join(entry['id'] for entry in absent if entry['kind'] == kind and entry['action'] == 'delete') or None for kind in RESOURCE_PATHS}
+    if apply and any(ids is not None for ids in delete_ids.values()):
+        summary = delete_resources(client, delete_ids['policies'], delete_ids['groups'], delete_ids['services'], max_workers)
+        print_to_stderr(json.dumps(summary))
+
+    for entry in absent:
+        status_code = 200
+        if apply and entry['action'] == 'delete':
+            status_code = summary[entry['kind']]['failed'].get(entry['id'], 200)
+        results[entry['key']] = {'status_code':status_code, 'id':None}
+
+    return plan, results
+
+#####################################################################
+# Service instance provisioning (asyncio)                           #
+#####################################################################
+DEFAULT_CONCURRENCY = 10
+
+# Resource names and tag used for a service instance, as in terraform/main.tf
+SERVICE_NAME_PREFIX = 'IA'
+INSTANCE_TAG_NAME   = 'service_identifier'
+
+# Service instance groups: the option that enables the group, its manifest key, type, and name suffix
+INSTANCE_GROUPS = [
+                      ('create_virtual_machine_group', 'virtual_machine_group', VIRTUAL_MACHINE, '-virtual-machines'),
+                      ('create_database_group',        'database_group',        DATABASE,        '-databases'),
+                      ('create_database_server_group', 'database_server_group', DATABASE_SERVER, '-database-servers')
+                  ]
+
+def instance_manifest(spec):
+    '''
+    Build the manifest for a service instance, naming resources the same
+    way as terraform/main.tf.
+
+    Parameters:
+        spec : The service instance. It has service_name and service_identifier,
+               and the same create_* options as the Terraform template.
+
+    Returns:
+        The manifest
+    '''
+    service_name = SERVICE_NAME_PREFIX + '-' + spec['service_name'] + '-' + spec['service_identifier']
+
+    groups = []
+    for option, key, type, suffix in INSTANCE_GROUPS:
+        if spec.get(option, False):
+            groups.append({'key': key, 'name': service_name + suffix, 'type': type,
+                           'tag_name': INSTANCE_TAG_NAME, 'tag_value': spec['service_identifier']})
+    group_keys = [group['key'] for group in groups]
+
+    manifest = {'groups': groups, 'services': [], 'policies': []}
+
+    service_groups = [key for key in ('virtual_machine_group', 'database_server_group') if key in group_keys]
+    if spec.get('create_service', False) and len(service_groups) > 0:
+        manifest['services'].append({'key': 'service', 'name': service_name, 'groups': service_groups})
+
+    if spec.get('create_virtual_machine_policy', False) and 'virtual_machine_group' in group_keys:
+        manifest['policies'].append({'key': 'virtual_machine_policy', 'name': service_name, 'groups': ['virtual_machine_group']})
+
+    return manifest
+
+class AsyncTurbonomicClient:
+    '''
+    An asyncio interface to a TurbonomicClient.
+
+    Each call runs the blocking TurbonomicClient operation on a worker
+    thread, so many calls can be in flight at once while sharing the
+    client's pooled connections and authentication cookie.
+    '''
+
+    def __init__(self, client, max_workers=DEFAULT_CONCURRENCY):
+        '''
+        Parameters:
+            client      : The TurbonomicClient that makes the requests
+            max_workers : Maximum number of calls in flight
+        '''
+        self.client = client
+        self.executor = ContextThreadPoolExecutor(max_workers=max_workers)
+
+    def close(self):
+        '''
+        Stop the worker threads. The TurbonomicClient is left open.
+        '''
+        self.executor.shutdown(wait=True)
+
+    async def _run(self, method, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(getattr(self.client, method), *args))
+
+    async def authenticate(self, user, password, cookie_cache=None):
+        return await self._run('authenticate', user, password, cookie_cache)
+
+    async def create_group(self, name, type, tag_name, tag_value):
+        return await self._run('create_group', name, type, tag_name, tag_value)
+
+    async def create_service(self, name, group_ids):
+        return await self._run('create_service', name, group_ids)
+
+    async def create_ia_vm_scale_policy(self, name, group_ids):
+        return await self._run('create_ia_vm_scale_policy', name, group_ids)
+
+    async def get_group(self, id):
+        return await self._run('get_group', id)
+
+    async def delete_group(self, id):
+        return await self._run('delete_group', id)
+
+    async def delete_service(self, id):
+        return await self._run('delete_service', id)
+
+    async def delete_policy(self, id):
+        return await self._run('delete_policy', id)
+
+async def run_manifest_async(client, steps, journal=None):
+    '''
+    Run manifest steps concurrently. Each step waits only for the groups
+    it depends on.
+
+    Parameters:
+        client  : A logged in AsyncTurbonomicClient
+        steps   : The steps returned by build_manifest_steps
+        journal : The Journal of steps completed by earlier runs, or None
+
+    Returns:
+        The result of each step, keyed by manifest key, as returned by run_manifest
+    '''
+    journal = journal or Journal()
+    results = {}
+    tasks = {}
+
+    async def run_step(step):
+        for dep in step['depends_on']:
+            await tasks[dep]
+
+        failed = [dep for dep in step['depends_on'] if results[dep]['status_code'] != 200]
+        if len(failed) > 0:
+            print_to_stderr('Skipping ' + step['key'] + ' because ' + ', '.join(failed) + ' could not be created')
+            results[step['key']] = {'status_code':'424', 'id':None}
+            return
+
+        result = journal.get(step['key'])
+        if result is not None:
+            results[step['key']] = result
+            return
+
+        # An error is the result of its step only, so the other steps still complete and are journaled
+        spec = step['spec']
+        try:
+            if step['kind'] == 'groups':
+                result = await client.create_group(spec['name'], spec['type'], spec['tag_name'], spec['tag_value'])
+            else:
+                group_ids = ','.join(results[ref]['id'] if ref in results else ref for ref in spec['groups'])
+                if step['kind'] == 'services':
+                    result = await client.create_service(spec['name'], group_ids)
+                else:
+                    result = await client.create_ia_vm_scale_policy(spec['name'], group_ids)
+        except requests.exceptions.RequestException as e:
+            print_to_stderr('Error creating ' + step['key'] + ': ' + str(e))
+            result = {'status_code':str(e), 'id':None}
+        results[step['key']] = result
+        journal.record(step['key'], result)
+
+    # Groups come first in the step list, so every dependency has a task before it is awaited
+    for step in steps:
+        tasks[step['key']] = asyncio.ensure_future(run_step(step))
+    await asyncio.gather(*tasks.values())
+
+    return results
+
+async def provision_instances(client, specs, concurrency=DEFAULT_CONCURRENCY, journal=None):
+    '''
+    Provision the Turbonomic resources for many service instances,
+    yielding the result for each instance as soon as it completes.
+
+    Parameters:
+        client      : A logged in AsyncTurbonomicClient
+        specs       : The service instances. See instance_manifest.
+        concurrency : Maximum number of service instances provisioned at the same time
+        journal     : The Journal of steps completed by earlier runs, or None
+
+    Yields:
+        A map with the service_identifier of the instance, an overall
+        status_code, and the IDs returned by manifest_return_data
+    '''
+    journal = journal or Journal()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def provision(spec):
+        async with semaphore:
+            if 'service_name' not in spec or 'service_identifier' not in spec:
+                print_to_stderr('Syntax error: service instance ' + json.dumps(spec) + ' requires service_name and service_identifier')
+                return {'service_identifier': spec.get('service_identifier'), 'status_code': '400'}
+
+            steps = build_manifest_steps(instance_manifest(spec))
+            if steps is None:
+                return {'service_identifier': spec['service_identifier'], 'status_code': '400'}
+
+            results = await run_manifest_async(client, steps, journal.scoped(spec['service_identifier']))
+
+            status = {'service_identifier': spec['service_identifier'], 'status_code': 200}
+            if any(result['status_code'] != 200 for result in results.values()):
+                status['status_code'] = next(result['status_code'] for result in results.values() if result['status_code'] != 200)
+            status.update(manifest_return_data(steps, results))
+            return status
+
+    for completed in asyncio.as_completed([provision(spec) for spec in specs]):
+        yield await completed
+
+async def provision_instances_main(client, specs, concurrency=DEFAULT_CONCURRENCY, journal=None, group_ids=None):
+    '''
+    Provision service instances, writing one JSON line to stdout for each
+    instance as it completes.
+
+    Parameters:
+        client      : A logged in AsyncTurbonomicClient
+        specs       : The service instances. See instance_manifest.
+        concurrency : Maximum number of service instances provisioned at the same time
+        journal     : The Journal of steps completed by earlier runs, or None
+        group_ids   : List that the IDs of the groups created are appended to, or None
+
+    Returns:
+        The number of service instances that could not be provisioned
+    '''
+    failed = 0
+    async for status in provision_instances(client, specs, concurrency, journal):
+        if status['status_code'] != 200:
+            failed += 1
+        if group_ids is not None:
+            group_ids.extend(split_ids(status.get('group_id')))
+        print(json.dumps(status), flush=True)
+
+    return failed
+
+#####################################################################
+# Bulk group creation                                               #
+#####################################################################
+
+# Name suffix for each group type, as used for service instance groups
+GROUP_NAME_SUFFIXES = {type: suffix for option, key, type, suffix in INSTANCE_GROUPS}
+
+def read_tag_values(tag_values):
+    '''
+    Get a list of tag values. Duplicates are removed.
+
+    Parameters:
+        tag_values : Comma separated tag values, or @path of a file that
+                     holds a JSON list of tag values or one tag value per line
+
+    Returns:
+        The list of tag values, or None if the file could not be read
+    '''
+    if not tag_values.startswith('@'):
+        values = tag_values.split(',')
+    else:
+        path = tag_values[1:]
+        try:
+            with open(path) as f:
+                text = f.read()
+            values = json.loads(text) if text.lstrip().startswith('[') else text.splitlines()
+        except (OSError, ValueError) as e:
+            print_to_stderr('Error reading tag values ' + path + ': ' + str(e))
+            return None
+
+    values = [str(value).strip() for value in values]
+    return list(dict.fromkeys(value for value in values if value))
+
+async def create_groups(client, tag_name, tag_values, group_types, name_prefix=SERVICE_NAME_PREFIX,
+                        concurrency=DEFAULT_CONCURRENCY, journal=None):
+    '''
+    Create one group of each type for each tag value, yielding the result
+    for each group as soon as it is created. The group for a tag value is
+    named <name_prefix>-<tag_value> followed by the suffix for its type.
+
+    Parameters:
+        client      : A logged in AsyncTurbonomicClient
+        tag_name    : Tag name of the group criteria
+        tag_values  : Tag values of the group criteria
+        group_types : Group types to create for each tag value
+        name_prefix : Prefix of the group names
+        concurrency : Maximum number of groups created at the same time
+        journal     : The Journal of groups created by earlier runs, or None
+
+    Yields:
+        A map with the tag_value and type of the group, its uuid, or None
+        if it was not created, and the status code of the request
+    '''
+    journal = journal or Journal()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def create(tag_value, group_type):
+        async with semaphore:
+            name = name_prefix + '-' + tag_value + GROUP_NAME_SUFFIXES[group_type]
+            status = journal.get(name)
+            if status is None:
+                try:
+                    status = await client.create_group(name, group_type, tag_name, tag_value)
+                except requests.exceptions.RequestException as e:
+                    print_to_stderr('Error creating group ' + name + ': ' + str(e))
+                    status = {'status_code':str(e), 'id':None}
+                journal.record(name, status)
+            return {'tag_value': tag_value, 'type': group_type, 'uuid': status['id'], 'status': status['status_code']}
+
+    creates = [create(tag_value, group_type) for tag_value in tag_values for group_type in group_types]
+    for completed in asyncio.as_completed(creates):
+        yield await completed
+
+async def create_groups_main(client, tag_name, tag_values, group_types, name_prefix=SERVICE_NAME_PREFIX,
+                             concurrency=DEFAULT_CONCURRENCY, journal=None, group_ids=None):
+    '''
+    Create groups for a list of tag values, writing one JSON line to
+    stdout for each group as it is created.
+
+    Parameters:
+        See create_groups. group_ids is a list that the IDs of the groups
+        created are appended to, or None.
+
+    Returns:
+        The number of groups that could not be created
+    '''
+    failed = 0
+    async for status in create_groups(client, tag_name, tag_values, group_types, name_prefix, concurrency, journal):
+        if status['status'] != 200:
+            failed += 1
+        elif group_ids is not None:
+            group_ids.append(status['uuid'])
+        print(json.dumps(status), flush=True)
+
+    return failed
+
+#####################################################################
+# Group membership wait                                             #
+#####################################################################
+
+# Seconds to wait for new groups to have members, and the delay between checks
+DEFAULT_MEMBERS_TIMEOUT = 300
+MEMBERS_POLL_DELAY      = 1
+MEMBERS_POLL_MAX_DELAY  = 30
+
+def wait_for_members(client, group_ids, timeout=DEFAULT_MEMBERS_TIMEOUT):
+    '''
+    Wait until new groups have members. Turbonomic adds the members of a
+    group with tag criteria some time after the group is created. The
+    groups that are still empty are checked together in each round, and
+    the rounds back off while no group gains members, until the time
+    runs out.
+
+    Parameters:
+        client    : A logged in TurbonomicClient
+        group_ids : List of group IDs
+        timeout   : Seconds to wait for all of the groups
+
+    Returns:
+        The members count of each group, keyed by group ID. It is 0 for a
+        group that was still empty when the time ran out, and None for a
+        group that could not be read.
+    '''
+    counts = {id: None for id in group_ids}
+    pending = list(counts)
+    deadline = time.monotonic() + timeout
+    delay = MEMBERS_POLL_DELAY
+
+    while len(pending) > 0:
+        try:
+            fetched = fetch_groups(client, pending)
+        except requests.exceptions.RequestException as e:
+            print_to_stderr('Error getting group members: ' + str(e))
+            fetched = {}
+
+        progress = False
+        for id, result in fetched.items():
+            if result['status_code'] == 200:
+                counts[id] = result['details'].get('membersCount') or 0
+                client.group_resolver.add(id, result['details'])
+                progress = progress or counts[id] > 0
+
+        # A group that was deleted is not waited for
+        pending = [id for id in pending if not counts[id] and fetched.get(id, {}).get('status_code') != 404]
+        if len(pending) == 0 or time.monotonic() >= deadline:
+            break
+
+        if progress:
+            delay = MEMBERS_POLL_DELAY
+        print_to_stderr(str(len(pending)) + ' groups have no members yet. Checking again in ' + '%.1f' % delay + ' seconds.')
+        time.sleep(max(0, min(delay, deadline - time.monotonic())))
+        delay = min(delay * 2, MEMBERS_POLL_MAX_DELAY)
+
+    if len(pending) > 0:
+        print_to_stderr(str(len(pending)) + ' groups had no members after ' + str(timeout) + ' seconds: ' + ', '.join(pending))
+
+    return counts
+
+def members_count(counts):
+    '''
+    Format the counts returned by wait_for_members for the
+    camc_scriptpackage resource.
+
+    Parameters:
+        counts : The members count of each group, keyed by group ID
+
+    Returns:
+        The comma separated counts, in the same order as the group IDs.
+        The count of a group that could not be read is empty.
+    '''
+    return ','.join('' if count is None else str(count) for count in counts.values())
+
+#####################################################################
+# Bulk delete                                                       #
+#####################################################################
+
+# Resource kinds in the order they must be deleted, with the client method that deletes each
+DELETE_TIERS = [('policies', 'delete_policy'), ('groups', 'delete_group'), ('services', 'delete_service')]
+
+def split_ids(ids):
+    '''
+    Split a comma separated list of IDs, dropping empty and duplicate IDs.
+
+    Parameters:
+        ids : Comma separated list of IDs, or None
+
+    Returns:
+        A list of IDs
+    '''
+    if ids is None:
+        return []
+    return list(dict.fromkeys(id.strip() for id in ids.split(',') if id.strip() != ''))
+
+def delete_resources(client, policy_ids=None, group_ids=None, service_ids=None, max_workers=DEFAULT_WORKERS):
+    '''
+    Delete policies, then groups, then services. The IDs within each tier
+    are deleted concurrently and every ID is attempted, even when others
+    fail. Each delete keeps the retry on a status code 500 done by
+    TurbonomicClient.delete_resource.
+
+    Parameters:
+        client      : A logged in TurbonomicClient
+        policy_ids  : Comma separated list of policy IDs, or None
+        group_ids   : Comma separated list of group IDs, or None
+        service_ids : Comma separated list of service IDs, or None
+        max_workers : Maximum number of deletes to run at the same time
+
+    Returns:
+        A summary keyed by policies, groups, and services. Each has
+            deleted   : IDs that were deleted
+            not_found : IDs that did not exist
+            failed    : Status code (or error) for each ID that could not be deleted
+    '''
+    ids_by_kind = {'policies': split_ids(policy_ids), 'groups': split_ids(group_ids), 'services': split_ids(service_ids)}
+    summary = {}
+
+    with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+        for kind, method in DELETE_TIERS:
+            tier = {'deleted': [], 'not_found': [], 'failed': {}}
+
+            # Groups already found not to exist during this run are not deleted again
+            ids = ids_by_kind[kind]
+            if kind == 'groups':
+                tier['not_found'] = [id for id in ids if client.group_resolver.known_missing(id)]
+                ids = [id for id in ids if id not in tier['not_found']]
+
+            futures = {executor.submit(getattr(client, method), id): id for id in ids}
+            for future in concurrent.futures.as_completed(futures):
+                id = futures[future]
+                try:
+                    status_code = future.result()
+                except requests.exceptions.RequestException as e:
+                    print_to_stderr('Error deleting ' + kind + ' id ' + id + ': ' + str(e))
+                    status_code = str(e)
+
+                if status_code == 200:
+                    tier['deleted'].append(id)
+                elif status_code == 404:
+                    tier['not_found'].append(id)
+                else:
+                    tier['failed'][id] = status_code
+            summary[kind] = tier
+
+    return summary
+
+# Seconds to wait for deletes to be confirmed, and the delay between checks
+DEFAULT_DELETE_TIMEOUT = 300
+DELETE_POLL_DELAY      = 0.5
+DELETE_POLL_MAX_DELAY  = 10
+
+# Failure recorded for a resource that was deleted but still existed when the time ran out
+DELETE_TIMED_OUT = '408'
+
+# Status codes of a failed DELETE that is sent again: the service deletion race, and transient errors
+DELETE_AGAIN_STATUS_CODES = (500,) + RETRY_STATUS_CODES
+
+def check_resources(client, kind, ids, executor):
+    '''
+    Check which resources of a kind still exist, with one paginated list
+    when there are many of them, or concurrent GETs.
+
+    Parameters:
+        client   : A logged in TurbonomicClient
+        kind     : groups, services, or policies
+        ids      : List of resource IDs
+        executor : The executor that runs the GETs
+
+    Returns:
+        A map of ID to status code, as returned by TurbonomicClient.check_resource
+    '''
+    if len(ids) < BATCH_LIST_THRESHOLD:
+        return dict(zip(ids, executor.map(functools.partial(client.check_resource, kind), ids)))
+
+    wanted = set(ids)
+    present = set()
+    try:
+        for resource in client.iter_resources(RESOURCE_PATHS[kind], kind):
+            if resource.get('uuid') in wanted:
+                present.add(resource['uuid'])
+    except (ListError, requests.exceptions.RequestException) as e:
+        return {id: getattr(e, 'status_code', str(e)) for id in ids}
+
+    return {id: 200 if id in present else 404 for id in ids}
+
+def delete_resources_async(client, policy_ids=None, group_ids=None, service_ids=None, max_workers=DEFAULT_WORKERS,
+                           timeout=DEFAULT_DELETE_TIMEOUT):
+    '''
+    Delete policies, groups, and services without waiting for each tier.
+    Every DELETE is sent at once, then batched existence checks confirm
+    which resources are gone. Only resources that are still there and
+    whose DELETE failed with the status code 500 of the service deletion
+    race, or a transient error, are deleted again. Other failures, such
+    as a 403 or a connection error, are not sent again. The checks back
+    off while nothing changes and stop when the time runs out.
+
+    Parameters:
+        client      : A logged in TurbonomicClient
+        policy_ids  : Comma separated list of policy IDs, or None
+        group_ids   : Comma separated list of group IDs, or None
+        service_ids : Comma separated list of service IDs, or None
+        max_workers : Maximum number of requests to run at the same time
+        timeout     : Seconds to wait for the deletes to be confirmed
+
+    Returns:
+        A summary in the same form as delete_resources. A resource that
+        still existed when the time ran out has status code 408.
+    '''
+    ids_by_kind = {'policies': split_ids(policy_ids), 'groups': split_ids(group_ids), 'services': split_ids(service_ids)}
+    summary = {kind: {'deleted': [], 'not_found': [], 'failed': {}} for kind, method in DELETE_TIERS}
+    deadline = time.monotonic() + timeout
+
+    with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        def delete(keys):
+            futures = {executor.submit(client.delete_resource, RESOURCE_PATHS[kind], RESOURCE_TYPES[kind], id, False): (kind, id)
+                       for kind, id in keys}
+            statuses = {}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    statuses[futures[future]] = future.result()
+                except requests.exceptions.RequestException as e:
+                    kind, id = futures[future]
+                    print_to_stderr('Error deleting ' + kind + ' id ' + id + ': ' + str(e))
+                    statuses[futures[future]] = str(e)
+            return statuses
+
+        # Status of the last DELETE of each resource that is not confirmed gone
+        pending = {}
+
+        def settle(statuses):
+            for (kind, id), status_code in statuses.items():
+                if status_code in (200, 404) or status_code in DELETE_AGAIN_STATUS_CODES:
+                    pending[(kind, id)] = status_code
+                else:
+                    pending.pop((kind, id), None)
+                    summary[kind]['failed'][id] = status_code
+
+        statuses = delete([(kind, id) for kind, method in DELETE_TIERS for id in ids_by_kind[kind]])
+        for (kind, id), status_code in list(statuses.items()):
+            if status_code == 404:
+                summary[kind]['not_found'].append(id)
+                del statuses[(kind, id)]
+        settle(statuses)
+
+        delay = DELETE_POLL_DELAY
+        while len(pending) > 0:
+            remaining = {}
+            for kind, method in DELETE_TIERS:
+                ids = [id for pending_kind, id in pending if pending_kind == kind]
+                if len(ids) == 0:
+                    continue
+                for id, status_code in check_resources(client, kind, ids, executor).items():
+                    if status_code == 404:
+                        summary[kind]['deleted'].append(id)
+                    else:
+                        remaining[(kind, id)] = pending[(kind, id)]
+
+            progress = len(remaining) < len(pending)
+            pending = remaining
+            if len(pending) == 0 or time.monotonic() >= deadline:
+                break
+
+            # A resource whose DELETE succeeded may still be being removed, so only failed deletes are sent again
+            settle(delete([key for key, status_code in pending.items() if status_code != 200]))
+            if len(pending) == 0:
+                break
+
+            delay = DELETE_POLL_DELAY if progress else min(delay * 2, DELETE_POLL_MAX_DELAY)
+            print_to_stderr(str(len(pending)) + ' resources are not deleted yet. Checking again in ' + '%.1f' % delay + ' seconds.')
+            time.sleep(max(0, min(delay, deadline - time.monotonic())))
+
+    for (kind, id), status_code in pending.items():
+        summary[kind]['failed'][id] = DELETE_TIMED_OUT if status_code == 200 else status_code
+
+    return summary
+
+#####################################################################
+# Orphan sweep                                                      #
+#####################################################################
+
+def is_orphan(kind, name, live_identifiers):
+    '''
+    Check whether a resource is named like the resources of a service
+    instance in terraform/main.tf, IA-<service_name>-<service_identifier>
+    with a suffix for groups, and belongs to none of the live instances.
+    Groups created for a list of tag values, IA-<tag_value> with a suffix,
+    are orphans when the tag value is not one of the live identifiers.
+
+    Parameters:
+        kind             : groups, services, or policies
+        name             : The display name of the resource
+        live_identifiers : Set of the service identifiers of the live instances
+
+    Returns:
+        True if the resource is an orphan
+    '''
+    if not name.startswith(SERVICE_NAME_PREFIX + '-'):
+        return False
+
+    if kind == 'groups':
+        suffix = next((suffix for suffix in GROUP_NAME_SUFFIXES.values() if name.endswith(suffix)), None)
+        if suffix is None:
+            return False
+        name = name[:-len(suffix)]
+    elif any(name.endswith(suffix) for suffix in GROUP_NAME_SUFFIXES.values()):
+        return False
+
+    # Service names and identifiers can both contain dashes, so every split is tried.
+    # The identifier of a group may also be all of the name after the prefix.
+    first = 1 if kind == 'groups' else 2
+    parts = name.split('-')
+    if len(parts) < first + 1:
+        return False
+    return not any('-'.join(parts[i:]) in live_identifiers for i in range(first, len(parts)))
+
+def find_orphans(client, live_identifiers, shared_policy_name=DEFAULT_SHARED_POLICY_NAME):
+    '''
+    List the groups, services, and policies, concurrently, and find the
+    ones left behind by service instances that are no longer live.
+
+    Parameters:
+        client             : A logged in TurbonomicClient
+        live_identifiers   : The service identifiers of the live instances
+        shared_policy_name : Name of the shared policy. It is never an orphan.
+
+    Returns:
+        The orphans, a list of {uuid, displayName} keyed by groups,
+        services, and policies, and the details of the shared policy, or
+        None. Returns None, None if a list could not be downloaded.
+    '''
+    live_identifiers = set(live_identifiers)
+    shared_policy = []
+
+    def list_orphans(kind):
+        orphans = []
+        for resource in client.iter_resources(RESOURCE_PATHS[kind], kind):
+            name = resource.get('displayName') or ''
+            if kind == 'policies' and name == shared_policy_name:
+                shared_policy.append(resource)
+            elif is_orphan(kind, name, live_identifiers):
+                orphans.append({'uuid': resource['uuid'], 'displayName': name})
+        return sorted(orphans, key=lambda orphan: orphan['displayName'])
+
+    with ContextThreadPoolExecutor(max_workers=len(DELETE_TIERS)) as executor:
+        futures = {kind: executor.submit(list_orphans, kind) for kind, method in DELETE_TIERS}
+        try:
+            orphans = {kind: future.result() for kind, future in futures.items()}
+        except ListError:
+            return None, None
+
+    return orphans, shared_policy[0] if len(shared_policy) > 0 else None
+
+def sweep_orphans(client, live_identifiers, apply=False, shared_policy_name=DEFAULT_SHARED_POLICY_NAME,
+                  max_workers=DEFAULT_WORKERS):
+    '''
+    Find the resources left behind by service instances that are no
+    longer live and, optionally, delete them. Orphan groups are removed
+    from the shared policy first, then the orphans are deleted in the
+    order used by delete_resources.
+
+    Parameters:
+        client             : A logged in TurbonomicClient
+        live_identifiers   : The service identifiers of the live instances
+        apply              : False to only report the orphans, True to delete them
+        shared_policy_name : Name of the shared policy
+        max_workers        : Maximum number of deletes to run at the same time
+
+    Returns:
+        A report with the orphans keyed by kind and, when applied, the
+        summary returned by delete_resources under deleted. Returns None
+        if the orphans could not be listed.
+    '''
+    orphans, shared_policy = find_orphans(client, live_identifiers, shared_policy_name)
+    if orphans is None:
+        return None
+
+    report = {'live': len(set(live_identifiers)), 'orphans': orphans}
+    print_to_stderr('Found ' + ', '.join(str(len(orphans[kind])) + ' orphan ' + kind for kind in orphans))
+    if not apply:
+        return report
+
+    print_to_stderr(json.dumps({'sweep': report}))
+
+    group_ids = [orphan['uuid'] for orphan in orphans['groups']]
+    if shared_policy is not None:
+        scoped = [id for id in group_ids if id in [scope.get('uuid') for scope in shared_policy.get('scopes') or []]]
+        if len(scoped) > 0:
+            status = client.update_shared_policy(shared_policy_name, ','.join(scoped), attach=False)
+            if status['status_code'] not in (200, 404):
+                print_to_stderr('Orphan groups could not be removed from shared policy ' + shared_policy_name)
+                report['deleted'] = None
+                return report
+
+    report['deleted'] = delete_resources(client,
+                                         ','.join(orphan['uuid'] for orphan in orphans['policies']),
+                                         ','.join(group_ids),
+                                         ','.join(orphan['uuid'] for orphan in orphans['services']),
+                                         max_workers)
+    return report
+
+#####################################################################
+# Daemon                                                            #
+#   TURBONOMIC_DAEMON_SOCKET : Unix socket the daemon listens on    #
+#####################################################################
+DAEMON_SOCKET_ENV = 'TURBONOMIC_DAEMON_SOCKET'
+
+# Environment variables forwarded from the CLI to the daemon
+DAEMON_ENV_PREFIX = 'TURBONOMIC_'
+
+def daemon_socket_path(environ):
+    '''
+    Get the path the daemon listens on.
+
+    Parameters:
+        environ : The environment variables
+
+    Returns:
+        The path of the Unix socket, TURBONOMIC_DAEMON_SOCKET or daemon.sock
+        in the per user directory
+    '''
+    return environ.get(DAEMON_SOCKET_ENV) or os.path.join(user_state_dir(), 'daemon.sock')
+
+def is_trusted_daemon(socket_path, sock):
+    '''
+    Check that a daemon socket belongs to the current user before the
+    password is sent to it.
+
+    Parameters:
+        socket_path : Path of the daemon socket
+        sock        : The socket connected to it
+
+    Returns:
+        True if the socket is owned by the current user and, where the
+        platform reports it, the process listening on it runs as the current user
+    '''
+    info = os.lstat(socket_path)
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        return False
+
+    # The owner of the path can change after it is checked, so also check the process that accepted the connection
+    if hasattr(socket, 'SO_PEERCRED'):
+        pid, uid, gid = struct.unpack('3i', sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')))
+        if uid != os.getuid():
+            return False
+    return True
+
+class ContextLocalStream:
+    '''
+    A stream that writes to a buffer while one is being captured in the
+    current context, and to the wrapped stream otherwise. The daemon uses
+    it for stdout and stderr so each request gets back only its own output.
+    Worker threads started through ContextThreadPoolExecutor run in a copy
+    of the context that submitted them, so their output is captured too.
+    '''
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = contextvars.ContextVar('buffer', default=None)
+
+    def write(self, data):
+        buffer = self.buffer.get()
+        return (buffer if buffer is not None else self.stream).write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+    @contextlib.contextmanager
+    def capture(self):
+        '''
+        Capture the output written in the current context.
+        '''
+        buffer = io.StringIO()
+        token = self.buffer.set(buffer)
+        try:
+            yield buffer
+        finally:
+            self.buffer.reset(token)
+
+class ContextThreadPoolExecutor(concurrent.futures.ThreadPoolExecutor):
+    '''
+    A ThreadPoolExecutor that runs each call in a copy of the context of
+    the thread that submitted it, so output captured by a
+    ContextLocalStream follows the work into the worker threads.
+    '''
+
+    def submit(self, fn, *args, **kwargs):
+        return concurrent.futures.ThreadPoolExecutor.submit(self, contextvars.copy_context().run, fn, *args, **kwargs)
+
+def resolve_path(path, cwd):
+    '''
+    Resolve a path given to the CLI against the directory it was run in.
+    The daemon runs in its own working directory, so relative paths
+    forwarded to it are resolved against the directory of the CLI.
+
+    Parameters:
+        path : The path, or @path for options that accept either a list or a file, or None
+        cwd  : Working directory of the CLI, or None to leave the path as it is
+
+    Returns:
+        The resolved path
+    '''
+    if path is None or cwd is None:
+        return path
+    if path.startswith('@'):
+        return '@' + os.path.join(cwd, path[1:])
+    return os.path.join(cwd, path)
+
+class DaemonRequestHandler(socketserver.StreamRequestHandler):
+    '''
+    Run one forwarded CLI invocation. The request is a JSON line with the
+    argv, TURBONOMIC_* environment, and working directory of the CLI. The response is a JSON
+    document with its exit_code, stdout, and stderr.
+    '''
+
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+
+        # Paths are relative to the directory the CLI was run in, not the daemon's
+        cwd = request.get('cwd')
+        environ = dict(request['env'])
+        for name in (CACHE_DIR_ENV, METRICS_TEXTFILE_ENV):
+            if environ.get(name):
+                environ[name] = resolve_path(environ[name], cwd)
+        if environ.get(ENDPOINTS_ENV, '').startswith('@'):
+            environ[ENDPOINTS_ENV] = resolve_path(environ[ENDPOINTS_ENV], cwd)
+
+        with sys.stdout.capture() as stdout, sys.stderr.capture() as stderr:
+            try:
+                exit_code = run(request['argv'], environ, self.server.client_for, cwd)
+            except SystemExit as e:
+                exit_code = e.code if isinstance(e.code, int) else 1
+            except Exception:
+                traceback.print_exc()
+                exit_code = 1
+
+        response = {'exit_code': exit_code, 'stdout': stdout.getvalue(), 'stderr': stderr.getvalue()}
+        self.wfile.write(json.dumps(response).encode('utf-8'))
+
+class TurbonomicDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    '''
+    A long lived process that runs CLI invocations forwarded over a Unix
+    socket. It keeps a logged in client per Turbonomic host and user, so
+    forwarded invocations skip interpreter startup, imports, the TLS
+    handshake, and the login.
+    '''
+    daemon_threads = True
+
+    def __init__(self, socket_path):
+        '''
+        Parameters:
+            socket_path : Path of the Unix socket to listen on
+        '''
+        self.clients = {}
+        self.clients_lock = threading.Lock()
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        old_umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, socket_path, DaemonRequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def client_for(self, host, user, password):
+        '''
+        Get a client for one run, forked from the warm client for the host and user.
+
+        Parameters:
+            host     : URL for the Turbonomic server
+            user     : Turbonomic user
+            password : Turbonomic users password
+
+        Returns:
+            A TurbonomicClient
+        '''
+        with self.clients_lock:
+            client = self.clients.get((host, user))
+            if client is None:
+                client = TurbonomicClient(host)
+                self.clients[(host, user)] = client
+            elif client.password != password:
+                client.set_auth_cookie(None)
+            client.user = user
+            client.password = password
+            return client.fork()
+
+def run_daemon(socket_path):
+    '''
+    Run the daemon until it is interrupted or terminated.
+
+    Parameters:
+        socket_path : Path of the Unix socket to listen on
+
+    Returns:
+        The exit code
+    '''
+    sys.stdout = ContextLocalStream(sys.stdout)
+    sys.stderr = ContextLocalStream(sys.stderr)
+    requests.packages.urllib3.disable_warnings(category=requests.packages.urllib3.exceptions.InsecureRequestWarning)
+
+    server = TurbonomicDaemon(socket_path)
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    print_to_stderr('Turbonomic daemon listening on ' + socket_path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+
+    return(0)
+
+def forward_to_daemon(socket_path, argv, environ):
+    '''
+    Run a CLI invocation in the daemon, if one is listening.
+
+    Parameters:
+        socket_path : Path of the daemon socket
+        argv        : The command line arguments
+        environ     : The environment variables
+
+    Returns:
+        The exit code, or None if no daemon is running or the request
+        could not be sent, so the invocation is run in this process
+    '''
+    if not os.path.exists(socket_path):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(socket_path)
+            trusted = is_trusted_daemon(socket_path, sock)
+        except OSError:
+            return None
+        if not trusted:
+            print_to_stderr('Not forwarding to ' + socket_path + ', it does not belong to the current user')
+            return None
+
+        env = {name: value for name, value in environ.items() if name.startswith(DAEMON_ENV_PREFIX)}
+        try:
+            sock.sendall(json.dumps({'argv': list(argv), 'env': env, 'cwd': os.getcwd()}).encode('utf-8') + b'\n')
+            sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            return None
+
+        # The daemon may have made API calls, so a run that fails now is not run again in this process
+        try:
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            response = json.loads(b''.join(chunks))
+        except (OSError, ValueError) as e:
+            print_to_stderr('The Turbonomic daemon on ' + socket_path + ' did not complete the request: ' + (str(e) or 'no response'))
+            return(1)
+    finally:
+        sock.close()
+
+    sys.stderr.write(response['stderr'])
+    sys.stdout.write(response['stdout'])
+    return response['exit_code']
+
+def print_to_stderr(message):
+    '''
+    Write a message to stderr. The camc_scriptpackage Terraform 
+    resource reads from stdout so we need to control what is sent
+    to stdout.
+
+    Parameters:
+        message : The message to write
+    '''
+    # print >> sys.stderr, message
+    # Write the message and newline together so lines from concurrent threads do not interleave
+    print(message + '\n', end='', file=sys.stderr)
+
+#####################################################################
+# Multiple Turbonomic instances                                     #
+#   TURBONOMIC_ENDPOINTS : Instances to run against, instead of     #
+#                          TURBONOMIC_ENDPOINT                      #
+#####################################################################
+ENDPOINTS_ENV = 'TURBONOMIC_ENDPOINTS'
+
+def read_endpoints(endpoints, environ):
+    '''
+    Get the Turbonomic instances to run against, with their credentials.
+
+    Parameters:
+        endpoints : Comma separated URLs, a JSON list, or @path of a file
+                    that holds a JSON list. Entries of a JSON list are URLs,
+                    or maps with an endpoint and optionally a user and password.
+        environ   : The environment variables. TURBONOMIC_USER and
+                    TURBONOMIC_PASSWORD are used for entries without them.
+
+    Returns:
+        A list of maps with the endpoint, user, and password of each
+        instance, or None if the endpoints are not valid
+    '''
+    try:
+        if endpoints.startswith('@'):
+            with open(endpoints[1:]) as f:
+                entries = json.load(f)
+        elif endpoints.lstrip().startswith('['):
+            entries = json.loads(endpoints)
+        else:
+            entries = [entry for entry in endpoints.split(',') if entry.strip()]
+    except (OSError, ValueError) as e:
+        print_to_stderr('Error reading ' + ENDPOINTS_ENV + ': ' + str(e))
+        return None
+
+    result = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            entry = {'endpoint': entry}
+        if 'endpoint' not in entry:
+            print_to_stderr('Syntax error: ' + ENDPOINTS_ENV + ' entry ' + json.dumps(entry) + ' is missing endpoint')
+            return None
+
+        endpoint = {
+                       'endpoint': str(entry['endpoint']).strip().rstrip('/'),
+                       'user':     entry.get('user', environ.get('TURBONOMIC_USER')),
+                       'password': entry.get('password', environ.get('TURBONOMIC_PASSWORD'))
+                   }
+        if endpoint['user'] is None or endpoint['password'] is None:
+            print_to_stderr('Syntax error: no credentials for Turbonomic endpoint ' + endpoint['endpoint'])
+            return None
+        if endpoint['endpoint'] in [other['endpoint'] for other in result]:
+            print_to_stderr('Syntax error: Turbonomic endpoint ' + endpoint['endpoint'] + ' is listed more than once')
+            return None
+        result.append(endpoint)
+
+    if len(result) == 0:
+        print_to_stderr('Syntax error: ' + ENDPOINTS_ENV + ' does not list any endpoints')
+        return None
+
+    return result
+
+def required_hosts(argv, count):
+    '''
+    Get the number of instances that must succeed for the run to succeed,
+    from the --required_hosts option.
+
+    Parameters:
+        argv  : The command line arguments
+        count : Number of instances
+
+    Returns:
+        The number of instances, or None if the option is not valid
+    '''
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--required_hosts', default='all')
+    args, _ = parser.parse_known_args(argv[1:])
+
+    if args.required_hosts == 'all':
+        return count
+    if args.required_hosts == 'any':
+        return 1
+    try:
+        required = int(args.required_hosts)
+    except ValueError:
+        required = 0
+    if required < 1 or required > count:
+        print_to_stderr('Syntax error: "--required_hosts" must be all, any, or a number from 1 to ' + str(count))
+        return None
+    return required
+
+def run_host(argv, environ, endpoint, client_factory, metrics, cwd=None):
+    '''
+    Run one CLI invocation against one Turbonomic instance, capturing
+    the output it writes from this thread and the worker threads it starts.
+
+    Parameters:
+        argv           : The command line arguments
+        environ        : The environment variables
+        endpoint       : The endpoint, user, and password of the instance
+        client_factory : Function that returns the TurbonomicClient for a host, user, and password
+        metrics        : The Metrics that API calls are recorded in
+        cwd            : Directory relative paths are resolved against, or None for the working directory
+
+    Returns:
+        The exit code, stdout, and stderr of the invocation
+    '''
+    host_environ = {name: value for name, value in environ.items() if name != ENDPOINTS_ENV}
+    host_environ['TURBONOMIC_ENDPOINT'] = endpoint['endpoint']
+    host_environ['TURBONOMIC_USER'] = endpoint['user']
+    host_environ['TURBONOMIC_PASSWORD'] = endpoint['password']
+
+    with sys.stdout.capture() as stdout, sys.stderr.capture() as stderr:
+        try:
+            exit_code = run_cli(argv, host_environ, client_factory, metrics, cwd=cwd)
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else 1
+        except Exception:
+            traceback.print_exc()
+            exit_code = 1
+
+    return exit_code, stdout.getvalue(), stderr.getvalue()
+
+def run_hosts(argv, environ, endpoints, client_factory, metrics, cwd=None):
+    '''
+    Run one CLI invocation against several Turbonomic instances in
+    parallel, each with its own client, session, and authentication
+    cookie. The output of each instance is written when it completes,
+    stderr with each line prefixed by the instance, and stdout as one
+    JSON document with the result for each instance. The output of the
+    worker threads an instance starts, such as manifest steps and
+    deletes, is captured with it. Only the summary of the whole run and
+    the combined API call metrics are written without a prefix.
+
+    Parameters:
+        argv           : The command line arguments
+        environ        : The environment variables
+        endpoints      : The instances returned by read_endpoints
+        client_factory : Function that returns the TurbonomicClient for a host, user, and password
+        metrics        : The Metrics that API calls are recorded in
+        cwd            : Directory relative paths are resolved against, or None for the working directory
+
+    Returns:
+        The exit code. The run fails if fewer instances succeed than
+        --required_hosts, which defaults to all of them.
+    '''
+    required = required_hosts(argv, len(endpoints))
+    if required is None:
+        return(1)
+
+    stdout, stderr = sys.stdout, sys.stderr
+    if not isinstance(stdout, ContextLocalStream):
+        sys.stdout = ContextLocalStream(stdout)
+    if not isinstance(stderr, ContextLocalStream):
+        sys.stderr = ContextLocalStream(stderr)
+
+    hosts = {}
+    try:
+        with ContextThreadPoolExecutor(max_workers=len(endpoints)) as executor:
+            futures = {executor.submit(run_host, argv, environ, endpoint, client_factory, metrics, cwd): endpoint['endpoint']
+                       for endpoint in endpoints}
+            for future in concurrent.futures.as_completed(futures):
+                host = futures[future]
+                exit_code, host_stdout, host_stderr = future.result()
+                for line in host_stderr.splitlines():
+                    print_to_stderr('[' + host + '] ' + line)
+
+                # Each line of stdout is a JSON document, usually just one
+                try:
+                    results = [json.loads(line) for line in host_stdout.splitlines() if line.strip()]
+                except ValueError:
+                    results = [host_stdout]
+                hosts[host] = {'exit_code': exit_code, 'result': results[0] if len(results) == 1 else (results or None)}
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+
+    succeeded = len([result for result in hosts.values() if result['exit_code'] == 0])
+    if succeeded < len(endpoints):
+        print_to_stderr(str(len(endpoints) - succeeded) + ' of ' + str(len(endpoints)) + ' Turbonomic instances failed')
+
+    # Data returned to the camc_scriptpackage resource
+    print(json.dumps({'hosts': {endpoint['endpoint']: hosts[endpoint['endpoint']] for endpoint in endpoints},
+                      'succeeded': succeeded, 'failed': len(endpoints) - succeeded}))
+
+    return(0 if succeeded >= required else 1)
+
+#####################################################################
+# Main                                                              #
+#####################################################################
+def main(argv=sys.argv):
+
+    # Run as a daemon that CLI invocations are forwarded to
+    #   --daemon
+    if argv[1:] == ['--daemon']:
+        return run_daemon(daemon_socket_path(os.environ))
+
+    # Forward to a running daemon only when TURBONOMIC_DAEMON_SOCKET is set, as the
+    # request includes the password. Otherwise, or if no daemon answers, run in this process.
+    if os.environ.get(DAEMON_SOCKET_ENV):
+        exit_code = forward_to_daemon(os.environ[DAEMON_SOCKET_ENV], argv, os.environ)
+        if exit_code is not None:
+            return exit_code
+
+    return run(argv, os.environ)
+
+def new_client(host, user, password):
+    '''
+    Get a client for one run of the CLI in this process.
+
+    Parameters:
+        host     : URL for the Turbonomic server
+        user     : Turbonomic user
+        password : Turbonomic users password
+
+    Returns:
+        A TurbonomicClient
+    '''
+    return TurbonomicClient(host)
+
+def run(argv, environ, client_factory=new_client, cwd=None):
+    '''
+    Run one CLI invocation and report the metrics for its API calls.
+
+    Parameters:
+        argv           : The command line arguments
+        environ        : The environment variables
+        client_factory : Function that returns the TurbonomicClient for a host, user, and password
+        cwd            : Directory relative paths are resolved against, or None for the working directory
+
+    Returns:
+        The exit code
+    '''
+    metrics = Metrics()
+
+    # Close the clients of this run when it ends. A forked client only closes
+    # the session it was given its own, see TurbonomicClient.mount_pool.
+    clients = []
+    def run_client_factory(factory):
+        def create_client(host, user, password):
+            client = factory(host, user, password)
+            clients.append(client)
+            return client
+        return create_client
+
+    # Run against several Turbonomic instances
+    if environ.get(ENDPOINTS_ENV):
+        endpoints = read_endpoints(environ[ENDPOINTS_ENV], environ)
+        if endpoints is None:
+            return(1)
+        if '--record' in argv or '--replay' in argv:
+            print_to_stderr('Syntax error: "--record" and "--replay" can not be used with ' + ENDPOINTS_ENV)
+            return(1)
+        try:
+            return run_hosts(argv, environ, endpoints, run_client_factory(client_factory), metrics, cwd)
+        finally:
+            for client in clients:
+                client.close()
+            metrics.report(environ.get(METRICS_TEXTFILE_ENV))
+
+    try:
+        cassette = open_cassette(argv, cwd)
+    except (OSError, ValueError) as e:
+        print_to_stderr('Error opening cassette: ' + str(e))
+        return(1)
+
+    # A recorded or replayed run uses its own client and logs in, so the
+    # cassette has every request
+    if cassette is not None:
+        client_factory = new_client
+
+    try:
+        return run_cli(argv, environ, run_client_factory(client_factory), metrics, cassette, cwd)
+    finally:
+        for client in clients:
+            client.close()
+        if cassette is not None:
+            cassette.close()
+        metrics.report(environ.get(METRICS_TEXTFILE_ENV))
+
+def run_cli(argv, environ, client_factory, metrics, cassette=None, cwd=None):
+    '''
+    Run one CLI invocation.
+
+    Parameters:
+        argv           : The command line arguments
+        environ        : The environment variables
+        client_factory : Function that returns the TurbonomicClient for a host, user, and password
+        metrics        : The Metrics that API calls are recorded in
+        cassette       : The Cassette that API calls are recorded in or replayed from, or None
+        cwd            : Directory relative paths are resolved against, or None for the working directory
+
+    Returns:
+        The exit code
+    '''
+
+    # Process Command Line Parameters
+    parser = argparse.ArgumentParser(
+             description='Create resources in Turbonomic. ',
+             epilog='')
+
+    # Usage:
+    # Start a daemon that keeps logged in connections. The socket is TURBONOMIC_DAEMON_SOCKET,
+    # or daemon.sock in the private turbonomic-<uid> directory in the temporary directory.
+    # Invocations with TURBONOMIC_DAEMON_SOCKET set forward their arguments and environment,
+    # including the password, over the socket if it is owned by the current user, and print
+    # the daemon's output.
+    # --daemon
+    #
+    # Any create option can be combined with -e (--ensure) to return the id of an existing
+    # resource with the same name instead of creating a duplicate.
+    #
+    # Create a service and add one or more groups to it.
+    # -s service_name -G groupd_ids
+    #
+    # Create a group. Add entities to this group based on a tag and tag value.
+    # -g group_name -T VirtualMachine|Database|DatabaseServer -t tag_nam> -v tag_value
+    #
+    # Create an IA Scale Action virtual machine policy and add it to one or more virtual machine groups
+    # -p group_name -G group_ids
+    #
+    # Add virtual machine groups to the scope of an IA Scale Action policy shared by many services,
+    # creating the policy if needed, or with -d remove them and delete the policy once its scope is empty.
+    # [-d] --shared_policy -p policy_name -G group_ids
+    #
+    # Delete resources. Optionally specify a list of service, group, or policy ids to delete.
+    # Policies, then groups, then services are deleted, each tier on up to "workers" threads.
+    # -d [-S service_ids] [-G groud_ids] [-P policy_ids] [-w workers]
+    #
+    # With --async_delete, every DELETE is sent at once and the deletes are confirmed by checking
+    # which resources still exist, deleting again only those whose DELETE failed, for up to
+    # "delete_timeout" seconds.
+    # -d --async_delete [--delete_timeout seconds] [-S service_ids] [-G groud_ids] [-P policy_ids] [-w workers]
+    #
+    # Create the groups, services, and policies described in a manifest file. Steps that
+    # do not depend on each other run concurrently on up to "workers" threads.
+    # -m manifest_file [-w workers]
+    #
+    # Compare a manifest with the resources that exist and print the changes needed to match it
+    # (--plan), or make only those changes (--reconcile). Entries with "absent": true are deleted.
+    # -m manifest_file --plan|--reconcile [-w workers]
+    #
+    # Provision many service instances, with up to "concurrency" instances in flight. The file
+    # holds a JSON list of {"service_name", "service_identifier", "create_*": true|false}. One
+    # JSON line with the ids of each instance is written to stdout as the instance completes.
+    # -i instances_file [-c concurrency]
+    #
+    # Create one group of each type for each tag value, with up to "concurrency" groups in flight.
+    # Tag values are comma separated, or @file for a file with one tag value per line or a JSON
+    # list. Group types are comma separated and default to all three. Groups are named
+    # <prefix>-<tag_value>-virtual-machines|-databases|-database-servers, and the prefix defaults
+    # to IA. One JSON line of {"tag_value", "type", "uuid", "status"} is written per group.
+    # -t tag_name -V tag_values|@file [-T group_types] [-g prefix] [-c concurrency]
+    #
+    # Any of the above can record its API calls to a cassette file, or replay them from one
+    # without a Turbonomic server. Replayed calls wait the recorded latency times the scale,
+    # so 0 replays as fast as possible. The password and session cookie are not recorded.
+    # --record cassette_file
+    # --replay cassette_file [--replay_scale scale]
+    #
+    # When TURBONOMIC_CACHE_DIR is set, each resource created by a run is journaled in that
+    # directory. If the run fails, running it again with the same arguments and input files
+    # skips the resources already created, and returns their ids. The journal is removed when
+    # the run succeeds, and --restart discards it and creates every resource again.
+    # [--restart]
+    #
+    # Find the groups, services, and policies named like a service instance, IA-<name>-<identifier>,
+    # and the groups named like those created for tag values, IA-<tag_value>, that do not belong to
+    # one of the live service identifiers or tag values. The identifiers are comma separated, or
+    # @file for a file with one identifier per line or a JSON list. Without -d the orphans are
+    # reported. With -d they are also deleted, after removing orphan groups from the shared policy,
+    # which is -p or IAScaleActionTest-shared.
+    # [-d] --sweep identifiers|@file [-p shared_policy_name] [-w workers]
+    #
+    # Creating groups, from the options, a manifest, service instances, or tag values, can wait
+    # until Turbonomic has added members to the new groups, checking them all together with a
+    # backoff for up to members_timeout seconds. The members count of each group is returned in
+    # "members_count", comma separated in the same order as "group_id". When one line is written
+    # per instance or group, a last JSON line {"members"} has the count keyed by group id.
+    # --wait_for_members [--members_timeout seconds]
+    #
+    # When TURBONOMIC_ENDPOINTS is set, any of the above runs against every Turbonomic instance
+    # it lists, in parallel, instead of TURBONOMIC_ENDPOINT. It is comma separated URLs, or a
+    # JSON list, or @file with a JSON list, of URLs or {"endpoint", "user", "password"} maps.
+    # Instances without credentials use TURBONOMIC_USER and TURBONOMIC_PASSWORD. The output is
+    # {"hosts": {endpoint: {"exit_code", "result"}}, "succeeded", "failed"}, and the run fails
+    # when fewer than the required number of instances succeed. The default is all of them.
+    # The log of each instance is written to stderr when it completes, each line prefixed by [endpoint].
+    # [--required_hosts all|any|count]
+    #
+    parser.add_argument('-s', '--create_service', dest='service_name', default=None, required=False)
+    parser.add_argument('-g', '--create_group', dest='group_name', default=None, required=False)
+    parser.add_argument('-T', '--group_type', dest='group_type', default=None, required=False)
+    parser.add_argument('-t', '--tag_name', dest='tag_name', required=False)
+    parser.add_argument('-v', '--tag_value', dest='tag_value', required=False)
+    parser.add_argument('-p', '--create_vm_policy', dest='vm_policy_name', default=None)
+    parser.add_argument('-d', '--delete', action='store_true', default=False)
+    parser.add_argument('--async_delete', action='store_true', default=False)
+    parser.add_argument('--delete_timeout', dest='delete_timeout', type=float, default=DEFAULT_DELETE_TIMEOUT, required=False)
+    parser.add_argument('--shared_policy', action='store_true', default=False)
+    parser.add_argument('-e', '--ensure', action='store_true', default=False)
+    parser.add_argument('-S', '--service_ids', dest='service_ids', default=None, required=False)
+    parser.add_argument('-G', '--group_ids', dest='group_ids', default=None, required=False)
+    parser.add_argument('-P', '--policy_ids', dest='policy_ids', default=None, required=False)
+    parser.add_argument('-m', '--manifest', dest='manifest', default=None, required=False)
+    parser.add_argument('--plan', action='store_true', default=False)
+    parser.add_argument('--reconcile', action='store_true', default=False)
+    parser.add_argument('-w', '--workers', dest='workers', type=int, default=DEFAULT_WORKERS, required=False)
+    parser.add_argument('-i', '--instances', dest='instances', default=None, required=False)
+    parser.add_argument('-V', '--tag_values', dest='tag_values', default=None, required=False)
+    parser.add_argument('-c', '--concurrency', dest='concurrency', type=int, default=DEFAULT_CONCURRENCY, required=False)
+    parser.add_argument('--record', dest='record', default=None, required=False)
+    parser.add_argument('--replay', dest='replay', default=None, required=False)
+    parser.add_argument('--replay_scale', dest='replay_scale', type=float, default=1.0, required=False)
+    parser.add_argument('--restart', action='store_true', default=False)
+    parser.add_argument('--sweep', dest='sweep', default=None, required=False)
+    parser.add_argument('--wait_for_members', action='store_true', default=False)
+    parser.add_argument('--members_timeout', dest='members_timeout', type=float, default=DEFAULT_MEMBERS_TIMEOUT, required=False)
+    parser.add_argument('--required_hosts', dest='required_hosts', default='all', required=False)
+
+    args = parser.parse_args(argv[1:])
+
+    # Input files are relative to the directory the CLI was run in, which is not the daemon's
+    args.manifest = resolve_path(args.manifest, cwd)
+    args.instances = resolve_path(args.instances, cwd)
+    if args.tag_values is not None and args.tag_values.startswith('@'):
+        args.tag_values = resolve_path(args.tag_values, cwd)
+    if args.sweep is not None and args.sweep.startswith('@'):
+        args.sweep = resolve_path(args.sweep, cwd)
+
+    service_name = args.service_name
+    group_name = args.group_name
+    group_type = args.group_type
+    tag_name = args.tag_name
+    tag_value = args.tag_value
+    vm_policy_name = args.vm_policy_name
+    delete = args.delete
+    service_ids = args.service_ids
+    group_ids = args.group_ids
+    policy_ids = args.policy_ids
+
+    # Validate arguments
+    if service_name is not None and group_ids is None:
+        print_to_stderr('Syntax error: To create a service at least one group id must be given')
+        return(1)
+
+    # Handle group type
+    if group_type is not None and args.tag_values is None:
+        if group_type.lower() == VIRTUAL_MACHINE_LOWER:
+            group_type = VIRTUAL_MACHINE
+        elif group_type.lower() == DATABASE_LOWER:
+            group_type = DATABASE
+        elif group_type.lower() == DATABASE_SERVER_LOWER:
+            group_type = DATABASE_SERVER
+
+        if group_type != VIRTUAL_MACHINE and group_type != DATABASE and group_type != DATABASE_SERVER:
+            print_to_stderr('The specified group type "' + group_type +'" is not valid. Valid values are ' + VIRTUAL_MACHINE + ', ' + DATABASE + ', and ' + DATABASE_SERVER)
+            return(1)
+
+    # Create group - check for required arguments
+    if group_name is not None and args.tag_values is None:
+        error = False
+        if group_type is None:
+            print_to_stderr('Syntax error: "--create_group" requires "--group_type"')
+            error = True
+
+        if tag_name is None:
+            print_to_stderr('Syntax error: "--create_group" requires "--tag_name"')
+            error = True
+
+        if tag_value is None:
+            print_to_stderr('Syntax error: "--create_group" requires "--tag_value"')
+            error = True
+
+        if error:
+            return(1)
+
+    # Validate create policy arguments
+    if vm_policy_name is not None:
+        if group_ids is None:
+            print_to_stderr('Syntax error: "--create_vm_policy" requires "--group_ids"')
+            return(1)
+
+    if args.shared_policy and (vm_policy_name is None or group_ids is None):
+        print_to_stderr('Syntax error: "--shared_policy" requires "--create_vm_policy" and "--group_ids"')
+        return(1)
+
+    # Read the manifest, service instances, or tag values before connecting
+    steps = None
+    if args.manifest is not None:
+        steps = load_manifest(args.manifest)
+        if steps is None:
+            return(1)
+
+        if not (args.plan or args.reconcile) and any(step['spec'].get('absent', False) for step in steps):
+            print_to_stderr('Syntax error: manifest entries with "absent" require "--plan" or "--reconcile"')
+            return(1)
+
+    specs = None
+    if args.instances is not None and steps is None:
+        try:
+            with open(args.instances) as f:
+                specs = json.load(f)
+        except (OSError, ValueError) as e:
+            print_to_stderr('Error reading service instances ' + args.instances + ': ' + str(e))
+            return(1)
+
+    tag_values = None
+    if args.tag_values is not None and steps is None and specs is None:
+        if tag_name is None:
+            print_to_stderr('Syntax error: "--tag_values" requires "--tag_name"')
+            return(1)
+
+        group_types = [VIRTUAL_MACHINE, DATABASE, DATABASE_SERVER]
+        if group_type is not None:
+            group_types = [normalize_group_type(value.strip()) for value in group_type.split(',')]
+            if None in group_types:
+                print_to_stderr('The specified group types "' + group_type + '" are not valid. Valid values are ' + VIRTUAL_MACHINE + ', ' + DATABASE + ', and ' + DATABASE_SERVER)
+                return(1)
+
+        tag_values = read_tag_values(args.tag_values)
+        if tag_values is None:
+            return(1)
+
+    live_identifiers = None
+    if args.sweep is not None and steps is None and specs is None and tag_values is None:
+        live_identifiers = read_tag_values(args.sweep)
+        if live_identifiers is None:
+            return(1)
+        if len(live_identifiers) == 0:
+            print_to_stderr('Syntax error: "--sweep" requires at least one live service identifier')
+            return(1)
+
+    # Get connection information
+    user = environ['TURBONOMIC_USER']
+    password = environ['TURBONOMIC_PASSWORD']
+    host = environ['TURBONOMIC_ENDPOINT']
+
+    host = host.strip().rstrip('/')
+
+    # Optionally share authentication cookies between runs. A recorded or replayed
+    # run logs in, so the cassette has every request.
+    cookie_cache = None
+    if cassette is None and environ.get(CACHE_DIR_ENV):
+        cookie_ttl = int(environ.get(COOKIE_TTL_ENV, DEFAULT_COOKIE_TTL))
+        cookie_cache = CookieCache(environ[CACHE_DIR_ENV], cookie_ttl)
+
+    # Set up a pooled connection to the server. The user logs in on the first API call.
+    client = client_factory(host, user, password)
+    client.metrics = metrics
+    client.ensure = args.ensure
+    if cassette is not None:
+        client.cassette = cassette
+        client.mount_pool(DEFAULT_POOL_SIZE)
+    client.retry_policy = RetryPolicy(int(environ.get(RETRY_ATTEMPTS_ENV, DEFAULT_RETRY_ATTEMPTS)),
+                                      int(environ.get(RETRY_BUDGET_ENV, DEFAULT_RETRY_BUDGET)))
+    client.timeout = (CONNECT_TIMEOUT, float(environ.get(REQUEST_TIMEOUT_ENV, DEFAULT_REQUEST_TIMEOUT)))
+    client.page_size = int(environ.get(PAGE_SIZE_ENV, DEFAULT_PAGE_SIZE))
+    rate_limit = float(environ.get(RATE_LIMIT_ENV, 0))
+    max_in_flight = int(environ.get(MAX_IN_FLIGHT_ENV, 0))
+    if rate_limit > 0 or max_in_flight > 0:
+        client.rate_limiter = RateLimiter(host_state_path(environ, 'ratelimit', host), rate_limit, max_in_flight, sum(client.timeout))
+    client.shared_policy_lock = host_state_path(environ, 'sharedpolicy', host) + '.lock'
+    if environ.get(CACHE_DIR_ENV) and client.workflow_index.path is None and cassette is None:
+        workflow_ttl = int(environ.get(WORKFLOW_TTL_ENV, DEFAULT_WORKFLOW_TTL))
+        client.workflow_index = WorkflowIndex(host_cache_path(environ[CACHE_DIR_ENV], 'workflows', host), workflow_ttl)
+    client.set_credentials(user, password, cookie_cache)
+
+    # Journal the resources created, so a run that fails can be resumed. Deletes,
+    # plans, and reconciles are not journaled, as they already skip what is done.
+    journal = Journal()
+    if environ.get(CACHE_DIR_ENV) and cassette is None and not delete and not args.plan and not args.reconcile and args.sweep is None:
+        input_paths = [path for path in (args.manifest, args.instances) if path is not None]
+        if args.tag_values is not None and args.tag_values.startswith('@'):
+            input_paths.append(args.tag_values[1:])
+        journal = Journal(journal_path(environ[CACHE_DIR_ENV], host, user, argv, input_paths))
+        if args.restart:
+            journal.complete()
+
+    # Create the resources described in a manifest
+    if steps is not None:
+        if args.plan or args.reconcile:
+            print_to_stderr('Comparing Turbnonomic resources with manifest ' + args.manifest + '...')
+            plan, results = reconcile_manifest(client, steps, args.reconcile, args.workers)
+            if results is None:
+                return(1)
+
+            if args.plan:
+                print(json.dumps({'plan': plan}))
+                return(0 if all(entry['action'] not in ('error', 'skip') for entry in plan) else 1)
+
+            print_to_stderr(json.dumps({'plan': plan}))
+
+            # Data returned to the camc_scriptpackage resource
+            print(json.dumps(manifest_return_data(steps, results)))
+
+            if any(result['status_code'] != 200 for result in results.values()):
+                return(1)
+            return(0)
+
+        print_to_stderr('Creating Turbnonomic resources from manifest ' + args.manifest + '...')
+        results = run_manifest(client, steps, args.workers, journal)
+
+        # Data returned to the camc_scriptpackage resource
+        return_data = manifest_return_data(steps, results)
+        if args.wait_for_members:
+            return_data['members_count'] = members_count(wait_for_members(client, split_ids(return_data['group_id']), args.members_timeout))
+        print(json.dumps(return_data))
+
+        if any(result['status_code'] != 200 for result in results.values()):
+            return(1)
+        journal.complete()
+        return(0)
+
+    # Provision a list of service instances
+    if specs is not None:
+        print_to_stderr('Provisioning ' + str(len(specs)) + ' service instances...')
+        client.mount_pool(args.concurrency)
+        async_client = AsyncTurbonomicClient(client, args.concurrency)
+        created_groups = []
+        try:
+            failed = asyncio.run(provision_instances_main(async_client, specs, args.concurrency, journal, created_groups))
+        finally:
+            async_client.close()
+
+        if args.wait_for_members:
+            print(json.dumps({'members': wait_for_members(client, created_groups, args.members_timeout)}))
+
+        if failed > 0:
+            print_to_stderr(str(failed) + ' service instances could not be provisioned')
+            return(1)
+        journal.complete()
+        return(0)
+
+    # Create groups for a list of tag values
+    if tag_values is not None:
+        print_to_stderr('Creating ' + str(len(tag_values) * len(group_types)) + ' Turbnonomic groups...')
+        client.mount_pool(args.concurrency)
+        async_client = AsyncTurbonomicClient(client, args.concurrency)
+        created_groups = []
+        try:
+            failed = asyncio.run(create_groups_main(async_client, tag_name, tag_values, list(dict.fromkeys(group_types)),
+                                                    group_name or SERVICE_NAME_PREFIX, args.concurrency, journal, created_groups))
+        finally:
+            async_client.close()
+
+        if args.wait_for_members:
+            print(json.dumps({'members': wait_for_members(client, created_groups, args.members_timeout)}))
+
+        if failed > 0:
+            print_to_stderr(str(failed) + ' groups could not be created')
+            return(1)
+        journal.complete()
+        return(0)
+
+    # Find and delete the resources of service instances that are no longer live
+    if live_identifiers is not None:
+        print_to_stderr(('Deleting' if delete else 'Finding') + ' orphan Turbnonomic resources...')
+        report = sweep_orphans(client, live_identifiers, delete, vm_policy_name or DEFAULT_SHARED_POLICY_NAME, args.workers)
+        if report is None:
+            return(1)
+
+        # Data returned to the camc_scriptpackage resource
+        print(json.dumps({'sweep': report}))
+
+        if delete and (report['deleted'] is None or any(len(tier['failed']) > 0 for tier in report['deleted'].values())):
+            return(1)
+        return(0)
+
+    # Remove groups from the shared policy
+    if delete and args.shared_policy:
+        status = client.update_shared_policy(vm_policy_name, group_ids, attach=False)
+        if status['status_code'] not in (200, 404):
+            return(1)
+        return(0)
+
+    if delete:
+        print_to_stderr('Deleting Turbnonomic resources...')
+
+        if args.async_delete:
+            summary = delete_resources_async(client, policy_ids, group_ids, service_ids, args.workers, args.delete_timeout)
+        else:
+            summary = delete_resources(client, policy_ids, group_ids, service_ids, args.workers)
+        print_to_stderr(json.dumps(summary))
+
+        if any(len(tier['failed']) > 0 for tier in summary.values()):
+            return(1)
+
+    else:
+        print_to_stderr('Creating Turbnonomic resources...')
+
+        service_id = None
+        group_id = None
+        policy_id = None
+
+        # Create a service and attach the specified groups
+        if service_name is not None:
+            status = journal.run('service', lambda: client.create_service(service_name, group_ids))
+            if status['status_code'] != 200:
+                return(1)
+            service_id = status['id']
+            print_to_stderr('Turbnonomic service ' + service_name + ' was created successfully')
+
+        # Create a group and add entities based on tag name and value
+        if group_name is not None:
+            status = journal.run('group', lambda: client.create_group(group_name, group_type, tag_name, tag_value))
+            if status['status_code'] != 200:
+                return(1)
+            group_id = status['id']
+            print_to_stderr('Turbnonomic group ' + group_name + ' was created successfully')
+
+        # Create a virtual machine policy scoped to group_ids, or add group_ids to the shared policy
+        if vm_policy_name is not None and args.shared_policy:
+            status = journal.run('policy', lambda: client.update_shared_policy(vm_policy_name, group_ids))
+            if status['status_code'] != 200:
+                return(1)
+            policy_id = status['id']
+            print_to_stderr('Turbnonomic shared policy ' + vm_policy_name + ' was updated successfully')
+
+        elif vm_policy_name is not None:
+            status = journal.run('policy', lambda: client.create_ia_vm_scale_policy(vm_policy_name, group_ids))
+            if status['status_code'] != 200:
+                return(1)
+            policy_id = status['id']
+            print_to_stderr('Turbnonomic policy ' + vm_policy_name + ' was created successfully')
+
+        # Data returned to the camc_scriptpackage resource
+        return_data = {
+                           'service_id' : service_id,
+                           'group_id'   : group_id,
+                           'policy_id'  : policy_id
+                      }
+        if args.wait_for_members and group_id is not None:
+            return_data['members_count'] = members_count(wait_for_members(client, [group_id], args.members_timeout))
+        print(json.dumps(return_data))
+        journal.complete()
+
+    return(0)
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
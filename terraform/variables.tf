@@ -27,3 +27,15 @@ variable "create_virtual_machine_policy" {
   description = "Whether or not to add a scale action policy to the virtual machine group"
   default = false
 }
+
+variable "share_virtual_machine_policy" {
+  type = bool
+  description = "Whether to add the virtual machine group to a scale action policy shared by all services instead of creating a policy for this service"
+  default = false
+}
+
+variable "wait_for_group_members" {
+  type = bool
+  description = "Whether to wait until Turbonomic has added the tagged resources to each group before continuing"
+  default = false
+}
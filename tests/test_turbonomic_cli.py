@@ -0,0 +1,262 @@
+# =================================================================
+# Copyright 2022 IBM Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =================================================================
+
+import io
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'terraform', 'modules', 'scripts'))
+
+import turbonomic_cli
+
+#####################################################################
+# iter_json_array                                                   #
+#####################################################################
+
+def split_every_way(data):
+    '''
+    Yield every split of the data into two chunks, and the data one byte per chunk.
+    '''
+    for i in range(len(data) + 1):
+        yield [data[:i], data[i:]]
+    yield [data[i:i + 1] for i in range(len(data))]
+
+@pytest.mark.parametrize('document', [
+    [],
+    [2.5, 12.5, 1e3, -1.5e-3, 0, -7, 1E+2],
+    [{'uuid': 'a', 'displayName': 'IA-svc-virtual-machines', 'membersCount': 10}, {'uuid': 'b'}],
+    ['escaped \" quote', 'unicode é中', [1, [2, [3]]], True, False, None],
+])
+def test_iter_json_array_any_chunk_split(document):
+    data = json.dumps(document).encode('utf-8')
+    for chunks in split_every_way(data):
+        assert list(turbonomic_cli.iter_json_array(chunks)) == document
+
+@pytest.mark.parametrize('chunks, expected', [
+    ([b'[2.', b'5]'], [2.5]),
+    ([b'[12.5, 1e', b'3]'], [12.5, 1000.0]),
+    ([b'[1e', b'-', b'3]'], [0.001]),
+    ([b'[1', b'0', b']'], [10]),
+    ([b'[-', b'4]'], [-4]),
+    ([b'[tr', b'ue, nu', b'll]'], [True, None]),
+])
+def test_iter_json_array_number_split(chunks, expected):
+    assert list(turbonomic_cli.iter_json_array(chunks)) == expected
+
+@pytest.mark.parametrize('chunks', [
+    [b'[2.]'],
+    [b'[1', b'e]'],
+    [b'[1, 2'],
+    [b'{"uuid": "a"}'],
+])
+def test_iter_json_array_invalid(chunks):
+    with pytest.raises(ValueError):
+        list(turbonomic_cli.iter_json_array(chunks))
+
+def test_streamed_response_size_counted_as_read():
+    client = turbonomic_cli.TurbonomicClient('http://turbonomic')
+    response = turbonomic_cli.requests.models.Response()
+    response.status_code = 200
+    response._content = b'[{"uuid": "a"}, {"uuid": "b"}]'
+    response._content_consumed = True
+
+    client.metrics.record('GET', '/groups', 200, 0, client._response_size(response, True, 'GET', '/groups'), 0.1, 0)
+    assert [item['uuid'] for item in turbonomic_cli.iter_json_array(response.iter_content(4))] == ['a', 'b']
+    assert client.metrics.summary()['operations']['GET /groups']['bytes_received'] == len(response._content)
+
+@pytest.mark.parametrize('headers', [
+    {'Set-Cookie': 'JSESSIONID=secret; Path=/', 'X-Next-Cursor': '20', 'Server': 'turbonomic'},
+    {'set-cookie': 'JSESSIONID=secret; Path=/', 'x-next-cursor': '20', 'server': 'turbonomic'},
+])
+def test_redact_header_names_any_case(headers):
+    path, recorded = turbonomic_cli.redact('/login?username=u&password=secret', headers)
+    assert path == '/login?username=u&password=REDACTED'
+    assert recorded == {'Set-Cookie': 'JSESSIONID=REDACTED; Path=/', 'X-Next-Cursor': '20'}
+
+#####################################################################
+# Output capture                                                    #
+#####################################################################
+
+def test_capture_follows_worker_threads(monkeypatch):
+    stream = turbonomic_cli.ContextLocalStream(io.StringIO())
+    monkeypatch.setattr(sys, 'stderr', stream)
+
+    def host(name):
+        with stream.capture() as buffer:
+            with turbonomic_cli.ContextThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(turbonomic_cli.print_to_stderr, [name + ' step ' + str(i) for i in range(4)]))
+            turbonomic_cli.print_to_stderr(name + ' done')
+        return buffer.getvalue()
+
+    with turbonomic_cli.ContextThreadPoolExecutor(max_workers=2) as executor:
+        a, b = executor.map(host, ['a', 'b'])
+
+    assert sorted(a.splitlines()) == ['a done', 'a step 0', 'a step 1', 'a step 2', 'a step 3']
+    assert sorted(b.splitlines()) == ['b done', 'b step 0', 'b step 1', 'b step 2', 'b step 3']
+    assert stream.stream.getvalue() == ''
+
+#####################################################################
+# is_orphan                                                         #
+#####################################################################
+
+@pytest.mark.parametrize('kind, name, live, orphan', [
+    # Service instance resources, IA-<service_name>-<service_identifier>
+    ('services', 'IA-web-svc1', {'svc1'}, False),
+    ('services', 'IA-web-svc1', {'svc2'}, True),
+    ('policies', 'IA-web-svc1', {'svc2'}, True),
+    ('groups', 'IA-web-svc1-virtual-machines', {'svc1'}, False),
+    ('groups', 'IA-web-svc1-databases', {'svc2'}, True),
+    ('groups', 'IA-web-svc1-database-servers', {'svc2'}, True),
+
+    # Dashes in the service name, the identifier, or both
+    ('services', 'IA-my-web-app-svc1', {'svc1'}, False),
+    ('services', 'IA-web-svc-123', {'svc-123'}, False),
+    ('services', 'IA-my-web-a1b2-c3d4', {'a1b2-c3d4'}, False),
+    ('groups', 'IA-my-web-a1b2-c3d4-virtual-machines', {'a1b2-c3d4'}, False),
+    ('groups', 'IA-my-web-a1b2-c3d4-virtual-machines', {'c3d4'}, False),
+    ('groups', 'IA-my-web-a1b2-c3d4-virtual-machines', {'e5f6-a7b8'}, True),
+
+    # Groups created for tag values, IA-<tag_value>
+    ('groups', 'IA-svc-123-virtual-machines', {'svc-123'}, False),
+    ('groups', 'IA-a1b2-c3d4-databases', {'a1b2-c3d4'}, False),
+    ('groups', 'IA-q1-database-servers', {'q1'}, False),
+    ('groups', 'IA-q1-virtual-machines', {'q2'}, True),
+    ('groups', 'IA-svc-123-virtual-machines', {'svc-124'}, True),
+
+    # Resources not named like a service instance are never orphans
+    ('groups', 'IA-svc1', set(), False),
+    ('groups', 'IA-virtual-machines', set(), False),
+    ('groups', 'Other-web-svc1-virtual-machines', set(), False),
+    ('services', 'IA-svc1', set(), False),
+    ('services', 'IA-web-svc1-virtual-machines', set(), False),
+    ('policies', 'IAScaleActionTest-shared', set(), False),
+])
+def test_is_orphan(kind, name, live, orphan):
+    assert turbonomic_cli.is_orphan(kind, name, live) == orphan
+
+#####################################################################
+# delete_resources_async                                            #
+#####################################################################
+
+class StubDeleteClient:
+    '''
+    Answers each DELETE and existence check of a resource with the next
+    of its status codes, repeating the last one.
+    '''
+
+    def __init__(self, deletes, checks):
+        self.deletes = deletes
+        self.checks = checks
+        self.deleted = []
+
+    def next_status(self, statuses, id):
+        return statuses[id].pop(0) if len(statuses[id]) > 1 else statuses[id][0]
+
+    def delete_resource(self, path, resource_type, id, retry_on_500=True):
+        self.deleted.append(id)
+        return self.next_status(self.deletes, id)
+
+    def check_resource(self, kind, id):
+        return self.next_status(self.checks, id)
+
+@pytest.fixture
+def fake_clock(monkeypatch):
+    now = [0.0]
+    def sleep(seconds):
+        now[0] += seconds
+    monkeypatch.setattr(turbonomic_cli.time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(turbonomic_cli.time, 'sleep', sleep)
+    return now
+
+def test_delete_async_sends_only_transient_failures_again(fake_clock):
+    client = StubDeleteClient(deletes={'g500': [500, 200], 'g403': [403], 'g200': [200]},
+                              checks={'g500': [200, 404], 'g200': [200]})
+
+    summary = turbonomic_cli.delete_resources_async(client, group_ids='g500,g403,g200', max_workers=2, timeout=30)
+
+    assert summary['groups']['deleted'] == ['g500']
+    assert summary['groups']['failed'] == {'g403': 403, 'g200': turbonomic_cli.DELETE_TIMED_OUT}
+    assert client.deleted.count('g500') == 2
+    assert client.deleted.count('g403') == 1
+    assert client.deleted.count('g200') == 1
+    assert fake_clock[0] >= 30
+
+#####################################################################
+# update_shared_policy                                              #
+#####################################################################
+
+class StubPolicyClient(turbonomic_cli.TurbonomicClient):
+    '''
+    A client for one shared policy with the ID p1, whose first PUTs are
+    answered with 200 but lost.
+    '''
+
+    def __init__(self, scope_ids, lost_puts=0):
+        super().__init__('http://turbonomic')
+        self.scope_ids = scope_ids
+        self.lost_puts = lost_puts
+        self.puts = []
+        self.deleted = []
+
+    def get_workflow(self, name, entity_type, action_type):
+        return 'w1'
+
+    def check_policy_scope(self, group_ids):
+        return None
+
+    def iter_resources(self, path, description):
+        yield {'uuid': 'p1', 'displayName': 'shared'}
+
+    def request(self, method, path, **kwargs):
+        response = turbonomic_cli.requests.models.Response()
+        response.status_code = 200
+        response._content = json.dumps({'uuid': 'p1', 'scopes': [{'uuid': id} for id in self.scope_ids]}).encode('utf-8')
+        return response
+
+    def update_resource(self, kind, resource_type, name, id, body):
+        self.puts.append([scope['uuid'] for scope in body['scopes']])
+        if self.lost_puts > 0:
+            self.lost_puts -= 1
+        else:
+            self.scope_ids = self.puts[-1]
+        return {'status_code':200, 'id':id}
+
+    def delete_resource(self, path, resource_type, id, retry_on_500=True):
+        self.deleted.append(id)
+        return 200
+
+def test_shared_policy_lost_update_is_sent_again(fake_clock):
+    client = StubPolicyClient(['g1'], lost_puts=1)
+
+    assert client.update_shared_policy('shared', 'g2') == {'status_code':200, 'id':'p1'}
+    assert client.puts == [['g1', 'g2'], ['g1', 'g2']]
+    assert client.scope_ids == ['g1', 'g2']
+
+def test_shared_policy_lost_updates_give_up(fake_clock):
+    client = StubPolicyClient(['g1'], lost_puts=turbonomic_cli.SHARED_POLICY_ATTEMPTS)
+
+    assert client.update_shared_policy('shared', 'g2') == {'status_code':'409', 'id':'p1'}
+    assert len(client.puts) == turbonomic_cli.SHARED_POLICY_ATTEMPTS
+
+def test_shared_policy_deleted_with_last_group(fake_clock):
+    client = StubPolicyClient(['g1'])
+
+    assert client.update_shared_policy('shared', 'g1', attach=False) == {'status_code':200, 'id':'p1'}
+    assert client.deleted == ['p1']
+    assert client.puts == []